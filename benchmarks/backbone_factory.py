@@ -0,0 +1,47 @@
+'''
+Micro-benchmark of the backbone start-up cost paid by every pipeline stage
+(first pretrain, second pretrain, active learning and the classifier).
+
+    python -m benchmarks.backbone_factory --backbone resnet18 --repeats 4
+'''
+
+import argparse
+import time
+
+import torchvision
+
+from models.backbones.resnet import resnet_backbone
+
+
+def eager_backbone(name):
+    # what resnet_backbone did before: build every architecture and keep one
+    resnets = {
+        "resnet18": torchvision.models.resnet18(pretrained=False),
+        "resnet50": torchvision.models.resnet50(pretrained=False),
+    }
+    return resnets[name]
+
+
+def timeit(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="backbone factory benchmark")
+    parser.add_argument("--backbone", default="resnet18", type=str)
+    parser.add_argument("--repeats", default=4, type=int, help="number of pipeline stages to simulate")
+    args = parser.parse_args()
+
+    results = {
+        "eager (both archs)": timeit(lambda: eager_backbone(args.backbone), args.repeats),
+        "lazy (requested arch)": timeit(lambda: resnet_backbone(args.backbone), args.repeats),
+        "cached template copy": timeit(lambda: resnet_backbone(args.backbone, cached=True), args.repeats),
+    }
+
+    for name, times in results.items():
+        print(f"{name:<24} first {times[0] * 1000:8.1f} ms\tper stage {sum(times) / len(times) * 1000:8.1f} ms\ttotal {sum(times) * 1000:8.1f} ms")
@@ -2,7 +2,7 @@ from random import shuffle
 import torch
 import torchvision
 from torchvision.transforms import ToTensor, Compose
-import torchvision.datasets as datasets
+from datautils.dataset_index import CachedImageFolder
 from models.self_sup.swav.transformation.swav_transformation import TransformsSwAV
 from models.utils.commons import get_params
 from models.utils.training_type_enum import TrainingType
@@ -13,6 +13,7 @@ from models.utils.transformations import Transforms
 
 class CIFAR10():
     def __init__(self, args, training_type=TrainingType.BASE_PRETRAIN) -> None:
+        self.args = args
         self.dir = args.dataset_dir + "/cifar10v2"
         self.method = args.method
 
@@ -23,7 +24,7 @@ class CIFAR10():
     def get_loader(self):
         if self.method is not SSL_Method.SWAV.value:
             if self.method == SSL_Method.SIMCLR.value:
-                transforms = TransformsSimCLR(self.image_size)
+                transforms = TransformsSimCLR(self.image_size, n_views=self.args.simclr_n_views)
 
             elif self.method == SSL_Method.DCL.value:
                 transforms = TransformsDCL(self.image_size)
@@ -42,8 +43,8 @@ class CIFAR10():
             #     download=True,
             #     transform=transforms)
 
-            dataset = datasets.ImageFolder(
-                self.dir,
+            dataset = CachedImageFolder(
+                self.args, self.dir,
                 transform=transforms)
 
             loader = torch.utils.data.DataLoader(
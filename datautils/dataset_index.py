@@ -0,0 +1,227 @@
+'''
+Index of the image folders read by the pretext and active learning datasets.
+
+The class-to-index manifest is built from a single scan of the directory tree and written
+atomically to the misc folder, so the datasets only look labels up in a dict while loading
+samples instead of touching the filesystem. It is keyed on the mtime of the image root, which
+changes when a class folder is added, removed or renamed.
+
+The file-list manifest caches the sorted image paths and labels of a folder in a compact
+binary file keyed on the folder and the mtimes of its class folders, so building a loader
+does not rescan the whole tree. Adding or removing images in a class folder changes its
+mtime and rebuilds the manifest; changes deeper than the class folders need an explicit
+invalidate_file_list.
+'''
+
+import glob
+import hashlib
+import io
+import json
+import os
+from functools import partial
+
+import numpy as np
+import torchvision.datasets as datasets
+from torchvision.datasets.folder import IMG_EXTENSIONS
+
+from datautils.dataset_enum import DatasetType, get_dataset_enum
+
+# (mtime, class-to-index dict) already loaded by this process, keyed on the image root
+_class_indices = {}
+
+# (signature, paths, labels) already loaded by this process, keyed on (root, recursive)
+_file_lists = {}
+
+
+def get_image_root(args):
+    """Returns the folder holding one sub folder of images per class for the target dataset"""
+    dir = args.dataset_dir + "/" + get_dataset_enum(args.target_dataset)
+
+    if args.target_dataset in [DatasetType.IMAGENET.value, DatasetType.CHEST_XRAY.value]:
+        return dir + "/train"
+
+    elif args.target_dataset == DatasetType.CIFAR10.value:
+        return args.dataset_dir + "/cifar10v2/train"
+
+    return dir
+
+
+def get_manifest_path(args, root, suffix):
+    """
+    Manifest file of `root`, named after its last folder (to be readable) and a hash of its
+    absolute path, so every spelling of a folder maps to one manifest and distinct folders don't
+    collide.
+    """
+    root = os.path.normpath(os.path.abspath(root))
+    digest = hashlib.sha1(root.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(args.model_misc_path, f"{os.path.basename(root)}_{digest}_{suffix}")
+
+
+def write_atomic(out, data: bytes):
+    tmp = f"{out}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as file:
+        file.write(data)
+    os.replace(tmp, out)
+
+
+def scan_classes(root):
+    return sorted(entry.name for entry in os.scandir(root) if entry.is_dir())
+
+
+def build_class_index(args, root, mtime):
+    classes = scan_classes(root)
+    manifest = {"root": root, "mtime": mtime, "classes": classes}
+
+    write_atomic(get_manifest_path(args, root, "classes.json"), json.dumps(manifest, indent=1).encode("utf-8"))
+
+    return {label: index for index, label in enumerate(classes)}
+
+
+def load_class_index(args, root):
+    """
+    Returns the class name to label index dict of `root`, building and saving the manifest
+    the first time the folder is seen. Adding, removing or renaming a class folder changes the
+    mtime of `root` and rebuilds it.
+    """
+    mtime = os.stat(root).st_mtime_ns
+    if root in _class_indices and _class_indices[root][0] == mtime:
+        return _class_indices[root][1]
+
+    out = get_manifest_path(args, root, "classes.json")
+    class_index = None
+    if os.path.isfile(out):
+        with open(out) as file:
+            manifest = json.load(file)
+
+        if manifest["root"] == root and manifest.get("mtime") == mtime:
+            class_index = {label: index for index, label in enumerate(manifest["classes"])}
+
+    if class_index is None:
+        class_index = build_class_index(args, root, mtime)
+
+    _class_indices[root] = (mtime, class_index)
+    return class_index
+
+
+def get_tree_signature(root):
+    """mtimes of the root and of every class folder, which change whenever a file is added or removed"""
+    signature = [[".", os.stat(root).st_mtime_ns]]
+    for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+        if entry.is_dir():
+            signature.append([entry.name, entry.stat().st_mtime_ns])
+
+    return signature
+
+
+def scan_files(root, recursive):
+    """
+    Lists the images of every class folder of `root`, sorted by class then path. The flat scan
+    matches glob(root + '/*/*'); the recursive one matches what ImageFolder collects.
+    """
+    paths, labels = [], []
+    for label, name in enumerate(scan_classes(root)):
+        class_dir = root + "/" + name
+
+        if recursive:
+            for dirpath, _, filenames in sorted(os.walk(class_dir, followlinks=True)):
+                for filename in sorted(filenames):
+                    if filename.lower().endswith(IMG_EXTENSIONS):
+                        paths.append(os.path.join(dirpath, filename))
+                        labels.append(label)
+        else:
+            for entry in sorted(os.scandir(class_dir), key=lambda entry: entry.name):
+                if not entry.name.startswith("."):
+                    paths.append(class_dir + "/" + entry.name)
+                    labels.append(label)
+
+    return paths, np.asarray(labels, dtype=np.int32)
+
+
+def get_file_list_manifest(args, root, recursive):
+    return get_manifest_path(args, root, "files_recursive.npz" if recursive else "files.npz")
+
+
+def build_file_list(args, root, signature, recursive=False):
+    paths, labels = scan_files(root, recursive)
+
+    encoded = [path.encode("utf-8") for path in paths]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(path) for path in encoded], out=offsets[1:])
+
+    buffer = io.BytesIO()
+    np.savez(
+        buffer, 
+        signature=np.array(json.dumps(signature)),
+        paths=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        offsets=offsets,
+        labels=labels)
+    write_atomic(get_file_list_manifest(args, root, recursive), buffer.getvalue())
+
+    return paths, labels
+
+
+def read_file_list(out, signature):
+    with np.load(out) as manifest:
+        if json.loads(str(manifest["signature"])) != signature:
+            return None
+
+        blob = manifest["paths"].tobytes()
+        offsets = manifest["offsets"].tolist()
+        paths = [blob[offsets[i]: offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+        return paths, manifest["labels"]
+
+
+def load_file_list(args, root, recursive=False):
+    """
+    Returns the sorted image paths under `root` with their class labels, reading them from the
+    cached manifest when the folder has not changed since it was written.
+    """
+    signature = get_tree_signature(root)
+
+    key = (root, recursive)
+    if key in _file_lists and _file_lists[key][0] == signature:
+        return _file_lists[key][1], _file_lists[key][2]
+
+    file_list = None
+    out = get_file_list_manifest(args, root, recursive)
+    if os.path.isfile(out):
+        file_list = read_file_list(out, signature)
+
+    if file_list is None:
+        file_list = build_file_list(args, root, signature, recursive)
+
+    _file_lists[key] = (signature, file_list[0], file_list[1])
+    return file_list
+
+
+def invalidate_file_list(args, root=None):
+    """Drops the cached file lists of `root`, or of every folder when no root is given"""
+    if root is None:
+        _file_lists.clear()
+        manifests = glob.glob(os.path.join(args.model_misc_path, "*_files.npz")) + \
+            glob.glob(os.path.join(args.model_misc_path, "*_files_recursive.npz"))
+    else:
+        for recursive in [False, True]:
+            _file_lists.pop((root, recursive), None)
+        manifests = [get_file_list_manifest(args, root, recursive) for recursive in [False, True]]
+
+    for out in manifests:
+        if os.path.isfile(out):
+            os.remove(out)
+
+
+class CachedImageFolder(datasets.ImageFolder):
+    """ImageFolder that takes its samples from the cached file-list manifest instead of walking the tree"""
+
+    def __init__(self, args, root, *folder_args, **folder_kwargs):
+        self.args = args
+        super(CachedImageFolder, self).__init__(root, *folder_args, **folder_kwargs)
+
+        # read the pre-decoded shards when they are there, see datautils/image_shards.py
+        from datautils.image_shards import load_image
+        self.loader = partial(load_image, args, loader=self.loader)
+
+    def make_dataset(self, directory, class_to_idx, *_, **__):
+        paths, labels = load_file_list(self.args, directory, recursive=True)
+        return list(zip(paths, labels.tolist()))
@@ -5,6 +5,7 @@ from torch.utils.data import random_split
 import torchvision.datasets as datasets
 import torchvision.transforms as transforms
 from datautils.dataset_enum import DatasetType
+from datautils.dataset_index import CachedImageFolder
 from models.active_learning.pretext_dataloader import PretextDataLoader
 
 from models.utils.commons import get_params, split_dataset
@@ -65,13 +66,13 @@ class LinearClassifier():
             traindir = os.path.join(self.dir, 'train')
             valdir = os.path.join(self.dir, 'val')
 
-            train_dataset = datasets.ImageFolder(
-                traindir,
+            train_dataset = CachedImageFolder(
+                self.args, traindir,
                 transform=train_transforms
                 )
 
-            val_dataset = datasets.ImageFolder(
-                valdir,
+            val_dataset = CachedImageFolder(
+                self.args, valdir,
                 transform=val_transforms
                 )
 
@@ -0,0 +1,201 @@
+'''
+Cache of pre-decoded images stored in memory-mappable uint8 shards.
+
+Decoding full resolution JPEG/PNG files dominates the CPU time of the data loaders, so the
+images of a dataset can be decoded once, resized to a maximum side length and written as raw
+HxWx3 uint8 arrays into shard files. The datasets then read them back as views of the memory
+mapped shards, and the existing transforms start from a cheap array instead of a compressed file.
+
+Build the cache offline with
+
+    python -m datautils.image_shards --image_cache_dir ./datasets/cache
+
+and set `image_cache_dir` in config.yaml to use it. Images that are not in the cache, or whose
+mtime or size changed since it was built, are still decoded from disk.
+'''
+
+import argparse
+import io
+import os
+from functools import partial
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+from datautils.dataset_index import load_file_list, write_atomic
+from utils.commons import pil_loader
+from utils.yaml_config_hook import yaml_config_hook
+import utils.logger as logging
+
+# shard stores already opened by this process, keyed on the cache dir
+_stores = {}
+
+
+def decode_image(path, max_side):
+    img = pil_loader(path)
+
+    scale = max_side / max(img.size)
+    if scale < 1:
+        img = img.resize((max(1, round(img.size[0] * scale)), max(1, round(img.size[1] * scale))), Image.BILINEAR)
+
+    return np.asarray(img, dtype=np.uint8)
+
+
+def prepare_shards(args, root, workers=4):
+    """Decodes every image under `root` and writes them to the shards of `args.image_cache_dir`"""
+    paths, _ = load_file_list(args, root, recursive=True)
+    out = args.image_cache_dir
+    os.makedirs(out, exist_ok=True)
+
+    shard_bytes = args.image_cache_shard_mb * 1024 * 1024
+    shards = np.zeros(len(paths), dtype=np.int32)
+    offsets = np.zeros(len(paths), dtype=np.int64)
+    shapes = np.zeros((len(paths), 3), dtype=np.int32)
+
+    # taken before decoding, so an image changed while the cache is built is never served
+    stats = [os.stat(path) for path in paths]
+    mtimes = np.array([stat.st_mtime_ns for stat in stats], dtype=np.int64)
+    sizes = np.array([stat.st_size for stat in stats], dtype=np.int64)
+
+    shard, written = 0, 0
+    file = open(os.path.join(out, f"shard_{shard:04d}.bin"), "wb")
+    with Pool(workers) as pool:
+        decoded = pool.imap(partial(decode_image, max_side=args.image_cache_max_side), paths, chunksize=64)
+        for i, img in enumerate(decoded):
+            if written > 0 and written + img.nbytes > shard_bytes:
+                file.close()
+                shard, written = shard + 1, 0
+                file = open(os.path.join(out, f"shard_{shard:04d}.bin"), "wb")
+
+            file.write(img.tobytes())
+            shards[i], offsets[i], shapes[i] = shard, written, img.shape
+            written += img.nbytes
+
+            if i % args.log_step == 0:
+                logging.info(f"Decoded [{i}/{len(paths)}] images into {shard + 1} shards")
+    file.close()
+
+    encoded = [os.path.normpath(path).encode("utf-8") for path in paths]
+    path_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(path) for path in encoded], out=path_offsets[1:])
+
+    # the index is written last, so a half written cache is never picked up
+    buffer = io.BytesIO()
+    np.savez(
+        buffer,
+        paths=np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        path_offsets=path_offsets,
+        shards=shards,
+        offsets=offsets,
+        shapes=shapes,
+        mtimes=mtimes,
+        sizes=sizes)
+    write_atomic(os.path.join(out, "index.npz"), buffer.getvalue())
+    _stores.pop(out, None)
+
+    logging.info(f"{len(paths)} images cached in {shard + 1} shards at {out}")
+
+
+class ImageShardStore():
+    def __init__(self, dir) -> None:
+        self.dir = dir
+        self._shards = {}
+
+        with np.load(os.path.join(dir, "index.npz")) as index:
+            blob = index["paths"].tobytes()
+            path_offsets = index["path_offsets"].tolist()
+            self.rows = {blob[path_offsets[i]: path_offsets[i + 1]].decode("utf-8"): i for i in range(len(path_offsets) - 1)}
+            self.shards = index["shards"]
+            self.offsets = index["offsets"]
+            self.shapes = index["shapes"]
+
+            # caches built before the files were tracked can't be checked
+            self.mtimes = index["mtimes"] if "mtimes" in index else None
+            self.sizes = index["sizes"] if "sizes" in index else None
+
+        self.warned = False
+        if self.mtimes is None:
+            logging.warn(f"The image cache at {dir} doesn't track the source files, rebuild it to detect changed images")
+
+    def _load_shard(self, shard):
+        if shard not in self._shards:
+            self._shards[shard] = np.memmap(os.path.join(self.dir, f"shard_{shard:04d}.bin"), dtype=np.uint8, mode="r")
+        return self._shards[shard]
+
+    def __contains__(self, path):
+        return os.path.normpath(path) in self.rows
+
+    def load(self, path):
+        """Returns the cached image of `path` as a PIL image, or None if it was not cached"""
+        row = self.rows.get(os.path.normpath(path))
+        if row is None:
+            return None
+
+        if self.mtimes is not None and not self.is_fresh(path, row):
+            if not self.warned:
+                logging.warn(f"{path} changed since the image cache at {self.dir} was built, decoding the changed images from disk")
+                self.warned = True
+            return None
+
+        shape = self.shapes[row]
+        start = self.offsets[row]
+        array = self._load_shard(int(self.shards[row]))[start: start + int(np.prod(shape))]
+        return Image.fromarray(array.reshape(shape))
+
+    def is_fresh(self, path, row):
+        """Whether `path` still has the mtime and size it had when it was cached"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+
+        return stat.st_mtime_ns == self.mtimes[row] and stat.st_size == self.sizes[row]
+
+    def __getstate__(self):
+        # memory maps are reopened lazily in DataLoader workers instead of being pickled
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+
+def get_shard_store(args):
+    if not args.image_cache_dir:
+        return None
+
+    if args.image_cache_dir not in _stores:
+        # a missing index is not remembered, so a cache built later in this process is picked up
+        if not os.path.isfile(os.path.join(args.image_cache_dir, "index.npz")):
+            return None
+        _stores[args.image_cache_dir] = ImageShardStore(args.image_cache_dir)
+
+    return _stores[args.image_cache_dir]
+
+
+def load_image(args, path, loader=pil_loader):
+    """Loads `path` from the shard cache when it is there, otherwise with `loader`"""
+    store = get_shard_store(args)
+    if store is not None:
+        img = store.load(path)
+        if img is not None:
+            return img
+
+    return loader(path)
+
+
+if __name__ == "__main__":
+    from datautils.target_dataset import get_target_pretrain_ds
+    from models.utils.training_type_enum import TrainingType
+
+    parser = argparse.ArgumentParser(description="CASL image cache")
+    config = yaml_config_hook("./config/config.yaml")
+    for k, v in config.items():
+        parser.add_argument(f"--{k}", default=v, type=type(v))
+    parser.add_argument("--root", default="", type=str, help="folder to cache, defaults to the target dataset folder")
+
+    args = parser.parse_args()
+    if not args.image_cache_dir:
+        parser.error("--image_cache_dir is required")
+
+    root = args.root or get_target_pretrain_ds(args, training_type=TrainingType.ACTIVE_LEARNING).dir
+    prepare_shards(args, root, workers=max(1, args.workers))
@@ -27,7 +27,7 @@ class ImageNet():
     def get_loader(self):
         if self.method is not SSL_Method.SWAV.value:
             if self.method == SSL_Method.SIMCLR.value:
-                transforms = TransformsSimCLR(self.image_size)
+                transforms = TransformsSimCLR(self.image_size, n_views=self.args.simclr_n_views)
 
             elif self.method == SSL_Method.DCL.value:
                 transforms = TransformsDCL(self.image_size)
@@ -0,0 +1,133 @@
+'''
+Columnar on-disk store for the per-image scores produced during active learning.
+
+A store is a directory holding:
+    paths.bin       utf-8 encoded image paths written back to back (the string table)
+    offsets.npy     int64 offsets into paths.bin, one more than the number of rows
+    <column>.npy    one array per scoring column, e.g. loss.npy
+
+Every file is opened lazily with memory mapping, so loading a store of millions of rows
+only costs a few mmap calls. New scoring columns are added as extra .npy files without
+rewriting the existing ones.
+'''
+
+import os
+import shutil
+import numpy as np
+
+from datautils.path_loss import PathLoss
+
+
+class PathLossStore():
+    def __init__(self, root, rows=None) -> None:
+        self.root = root
+        self._offsets = None
+        self._paths = None
+        self._columns = {}
+
+        self.rows = range(len(self._load_offsets()) - 1) if rows is None else rows
+
+    @staticmethod
+    def exists(root):
+        return os.path.isfile(os.path.join(root, "offsets.npy"))
+
+    @staticmethod
+    def write(root, paths, losses):
+        """
+        Writes a new store at `root` holding `paths` and their `losses`, replacing any
+        previous store at that location.
+        """
+        tmp = root + ".tmp"
+        if os.path.isdir(tmp):
+            shutil.rmtree(tmp)
+        os.makedirs(tmp)
+
+        encoded = [path.encode("utf-8") for path in paths]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(path) for path in encoded], out=offsets[1:])
+
+        with open(os.path.join(tmp, "paths.bin"), "wb") as file:
+            file.write(b"".join(encoded))
+        np.save(os.path.join(tmp, "offsets.npy"), offsets)
+        np.save(os.path.join(tmp, "loss.npy"), np.asarray(losses, dtype=np.float32))
+
+        if os.path.isdir(root):
+            shutil.rmtree(root)
+        os.rename(tmp, root)
+
+        return PathLossStore(root)
+
+    def _load_offsets(self):
+        if self._offsets is None:
+            self._offsets = np.load(os.path.join(self.root, "offsets.npy"), mmap_mode="r")
+        return self._offsets
+
+    def _load_paths(self):
+        if self._paths is None:
+            # np.memmap refuses to map an empty file
+            if self._load_offsets()[-1] == 0:
+                self._paths = np.empty(0, dtype=np.uint8)
+            else:
+                self._paths = np.memmap(os.path.join(self.root, "paths.bin"), dtype=np.uint8, mode="r")
+        return self._paths
+
+    def _load_column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.load(os.path.join(self.root, f"{name}.npy"), mmap_mode="r")
+        return self._columns[name]
+
+    def _as_slice(self):
+        stop = self.rows.stop if self.rows.stop >= 0 else None
+        return slice(self.rows.start, stop, self.rows.step)
+
+    def path(self, row):
+        offsets = self._load_offsets()
+        return bytes(self._load_paths()[offsets[row]: offsets[row + 1]]).decode("utf-8")
+
+    def column(self, name):
+        """Returns the values of a scoring column for the rows of this store, in rank order"""
+        return self._load_column(name)[self._as_slice()]
+
+    def column_names(self):
+        return sorted(
+            filename[:-len(".npy")] for filename in os.listdir(self.root)
+            if filename.endswith(".npy") and filename != "offsets.npy")
+
+    def add_column(self, name, values):
+        """
+        Adds (or replaces) a scoring column. Only the new column file is written; `values`
+        must hold one entry per row of the whole store.
+        """
+        values = np.asarray(values)
+        total = len(self._load_offsets()) - 1
+        if len(values) != total:
+            raise ValueError(f"column '{name}' has {len(values)} values but the store has {total} rows")
+
+        out = os.path.join(self.root, f"{name}.npy")
+        np.save(out + ".tmp.npy", values)
+        os.replace(out + ".tmp.npy", out)
+        self._columns.pop(name, None)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            view = PathLossStore.__new__(PathLossStore)
+            view.__dict__.update(self.__dict__)
+            view._columns = dict(self._columns)
+            view.rows = self.rows[idx]
+            return view
+
+        row = self.rows[idx]
+        return PathLoss(self.path(row), float(self._load_column("loss")[row]))
+
+    def __iter__(self):
+        for i in range(len(self.rows)):
+            yield self[i]
+
+    def __getstate__(self):
+        # memory maps are reopened lazily in DataLoader workers instead of being pickled
+        state = self.__dict__.copy()
+        state["_offsets"], state["_paths"], state["_columns"] = None, None, {}
+        return state
@@ -0,0 +1,75 @@
+'''
+Host to device copies of the batches of a DataLoader that overlap with the compute.
+
+On CUDA the next batch is copied on a side stream while the current one is being computed,
+so the transfer of the pinned batches is hidden behind the compute of the step. On other
+devices the batches are moved as they come.
+'''
+
+import torch
+
+from utils.device import to_device
+
+
+def move_batch(args, batch):
+    """Moves every tensor of a (nested) batch to the device, anything else is left as it is"""
+    if torch.is_tensor(batch):
+        return to_device(args, batch)
+
+    if isinstance(batch, (list, tuple)):
+        return type(batch)(move_batch(args, x) for x in batch)
+
+    if isinstance(batch, dict):
+        return {k: move_batch(args, v) for k, v in batch.items()}
+
+    return batch
+
+
+def record_stream(batch, stream):
+    if torch.is_tensor(batch):
+        batch.record_stream(stream)
+
+    elif isinstance(batch, (list, tuple)):
+        for x in batch:
+            record_stream(x, stream)
+
+    elif isinstance(batch, dict):
+        for x in batch.values():
+            record_stream(x, stream)
+
+
+class Prefetcher():
+    def __init__(self, args, loader) -> None:
+        self.args = args
+        self.loader = loader
+        self.stream = torch.cuda.Stream() if torch.device(args.device).type == "cuda" else None
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __iter__(self):
+        if self.stream is None:
+            for batch in self.loader:
+                yield move_batch(self.args, batch)
+            return
+
+        batches = iter(self.loader)
+        next_batch = self.preload(batches)
+        while next_batch is not None:
+            torch.cuda.current_stream().wait_stream(self.stream)
+            batch = next_batch
+
+            # the batch was allocated on the side stream but is used on the compute stream
+            record_stream(batch, torch.cuda.current_stream())
+
+            next_batch = self.preload(batches)
+            yield batch
+
+    def preload(self, batches):
+        try:
+            batch = next(batches)
+        except StopIteration:
+            return None
+
+        with torch.cuda.stream(self.stream):
+            return move_batch(self.args, batch)
@@ -11,6 +11,7 @@ from models.utils.training_type_enum import TrainingType
 from models.utils.ssl_method_enum import SSL_Method
 
 from datautils import dataset_enum
+from datautils.dataset_index import CachedImageFolder
 from models.utils.transformations import Transforms
 
 class TargetDataset():
@@ -30,8 +31,8 @@ class TargetDataset():
     def get_dataset(self, transforms):
         return MakeBatchDataset(
             self.args,
-            self.dir, self.with_train, self.is_train, transforms) if self.training_type == TrainingType.ACTIVE_LEARNING else torchvision.datasets.ImageFolder(
-                                                                                                self.dir,
+            self.dir, self.with_train, self.is_train, transforms) if self.training_type == TrainingType.ACTIVE_LEARNING else CachedImageFolder(
+                                                                                                self.args, self.dir,
                                                                                                 transform=transforms)
 
     def get_finetuner_loaders(self, train_batch_size, val_batch_size):
@@ -65,7 +66,7 @@ class TargetDataset():
 
             else:
                 if self.method == SSL_Method.SIMCLR.value:
-                    transforms = TransformsSimCLR(self.image_size)
+                    transforms = TransformsSimCLR(self.image_size, n_views=self.args.simclr_n_views)
 
                 if self.method == SSL_Method.DCL.value:
                     transforms = TransformsDCL(self.image_size)
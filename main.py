@@ -10,6 +10,7 @@ from torch.utils.tensorboard import SummaryWriter
 from models.active_learning.pretext_trainer import PretextTrainer
 from utils.commons import load_path_loss, load_saved_state, simple_load_model
 from utils.random_seeders import set_random_seeds
+from utils.device import configure_device
 
 from utils.yaml_config_hook import yaml_config_hook
 from models.trainers.selfsup_pretrainer import SelfSupPretrainer
@@ -59,7 +60,7 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
-    args.device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+    args.device = configure_device(args)
     print(f"You are using {args.device}")
     args.num_gpus = torch.cuda.device_count()
     args.world_size = args.gpus * args.nodes
@@ -2,18 +2,17 @@ import torch
 import torchvision.transforms as transforms
 from typing import List
 from PIL import Image
-import random
-import glob
 from datautils.path_loss import PathLoss
 from models.self_sup.simclr.transformation.simclr_transformations import TransformsSimCLR
 from models.self_sup.simclr.transformation.dcl_transformations import TransformsDCL
 from models.self_sup.swav.transformation.multicropdataset import PILRandomGaussianBlur, get_color_distortion
 from models.utils.commons import get_params
 from models.utils.transformations import Transforms
-from utils.commons import load_class_names, pil_loader, save_class_names
+from datautils.image_shards import load_image
 from models.utils.training_type_enum import TrainingType
 from models.utils.ssl_method_enum import SSL_Method
 from datautils.dataset_enum import DatasetType, get_dataset_enum
+from datautils.dataset_index import get_image_root, load_class_index, load_file_list
 # import cv2
 
 labels = {}
@@ -32,12 +31,7 @@ class PretextDataLoader():
         if is_val:
             val_path_loss_list = []
 
-            if self.args.target_dataset in [DatasetType.IMAGENET.value, DatasetType.CHEST_XRAY.value]:
-                img_paths = glob.glob(self.dir + '/train/*/*')# img_paths = glob.glob(self.dir + '/train/*/*/*')
-            elif self.args.target_dataset == DatasetType.CIFAR10.value:
-                img_paths = glob.glob(self.args.dataset_dir + '/cifar10v2/train/*/*')
-            else:
-                img_paths = glob.glob(self.dir + '/*/*')
+            img_paths, _ = load_file_list(self.args, get_image_root(self.args))
 
             for path in img_paths[0:len(path_loss_list)]:
                 val_path_loss_list.append(PathLoss(path, 0))     
@@ -69,7 +63,7 @@ class PretextDataLoader():
 
             else:
                 if self.args.method == SSL_Method.SIMCLR.value:
-                    transforms = TransformsSimCLR(self.image_size)
+                    transforms = TransformsSimCLR(self.image_size, n_views=self.args.simclr_n_views)
 
                 elif self.args.method == SSL_Method.DCL.value:
                     transforms = TransformsDCL(self.image_size)
@@ -100,14 +94,7 @@ class PretextDataset(torch.utils.data.Dataset):
         self.transform = transform
         self.is_val = is_val
 
-        labels = set(load_class_names(self.args))
-        index = 0
-        self.label_dic = {}
-        for label in labels:
-            label = label.replace("\n", "")
-            if label not in self.label_dic:
-                self.label_dic[label] = index
-                index += 1
+        self.label_dic = load_class_index(self.args, get_image_root(self.args))
 
     def __len__(self):
         return len(self.pathloss_list)
@@ -121,9 +108,9 @@ class PretextDataset(torch.utils.data.Dataset):
             path = path_loss.path
 
         if self.args.target_dataset in [DatasetType.CHEST_XRAY.value, DatasetType.IMAGENET.value]:
-            img = pil_loader(path)
+            img = load_image(self.args, path)
         else:
-            img = Image.open(path)
+            img = load_image(self.args, path, Image.open)
 
         if self.args.target_dataset == DatasetType.IMAGENET.value:
             label = path.split('/')[-2]# label = path.split('/')[-3]
@@ -175,9 +162,9 @@ class PretextMultiCropDataset(torch.utils.data.Dataset):
 
 
         if self.args.target_dataset in [DatasetType.CHEST_XRAY.value, DatasetType.IMAGENET.value]:
-            image = pil_loader(path)
+            image = load_image(self.args, path)
         else:
-            image = Image.open(path)
+            image = load_image(self.args, path, Image.open)
 
         multi_crops = list(map(lambda trans: trans(image), self.trans))
         return multi_crops #TODO: Check the len of this multi_crops. Also check if you can use a mined view and an aug view here instead of just aug views.
@@ -195,13 +182,8 @@ class MakeBatchDataset(torch.utils.data.Dataset):
 
         self.is_train = is_train
 
-        if with_train:
-            if self.dir in ["./datasets/imagenet", "./datasets/chest_xray"]:
-                self.img_path = glob.glob(self.dir + '/train/*/*')# self.img_path = glob.glob(self.dir + '/train/*/*/*')
-            else:
-                self.img_path = glob.glob(self.dir + '/train/*/*')
-        else:
-            self.img_path = glob.glob(self.dir + '/*/*')
+        self.root = self.dir + '/train' if with_train else self.dir
+        self.img_path, _ = load_file_list(self.args, self.root)
         self.transform = transform
 
     def __len__(self):
@@ -209,36 +191,15 @@ class MakeBatchDataset(torch.utils.data.Dataset):
 
     def __getitem__(self, idx):
         if self.dir in ["./datasets/chest_xray", "./datasets/imagenet", "./datasets/food"]:
-            img = pil_loader(self.img_path[idx])
+            img = load_image(self.args, self.img_path[idx])
         else:
-            img = Image.open(self.img_path[idx])
+            img = load_image(self.args, self.img_path[idx], Image.open)
 
         path = self.img_path[idx] 
-        if self.dir == "./datasets/imagenet":
-            label = path.split('/')[-2]# label = path.split('/')[-3]
-        else:
-            label = path.split('/')[-2]
-        
-        save_class_names(self.args, label)
-        
+
+        # the four rotations are generated for the whole batch on the training device,
+        # see models/active_learning/rotation.py
         if self.is_train:
-            img = self.transform.__call__(img)
-            img1 = torch.rot90(img, 1, [1,2])
-            img2 = torch.rot90(img, 2, [1,2])
-            img3 = torch.rot90(img, 3, [1,2])
-            imgs = [img, img1, img2, img3]
-            rotations = [0, 1, 2, 3]
-            random.shuffle(rotations)
-
-            return imgs[rotations[0]], imgs[rotations[1]], imgs[rotations[2]], imgs[rotations[3]], rotations[0], rotations[1], rotations[2], rotations[3]
+            return self.transform.__call__(img)
         else:
-            img = self.transform.__call__(img, False)
-            img1 = torch.rot90(img, 1, [1,2])
-            img2 = torch.rot90(img, 2, [1,2])
-            img3 = torch.rot90(img, 3, [1,2])
-            imgs = [img, img1, img2, img3]
-            rotations = [0, 1, 2, 3]
-            random.shuffle(rotations)
-
-            # print(imgs[rotations[0]].shape, imgs[rotations[1]].shape, imgs[rotations[2]].shape, imgs[rotations[3]].shape)
-            return imgs[rotations[0]], imgs[rotations[1]], imgs[rotations[2]], imgs[rotations[3]], rotations[0], rotations[1], rotations[2], rotations[3], path
\ No newline at end of file
+            return self.transform.__call__(img, False), path
@@ -6,21 +6,27 @@ import time
 import numpy as np
 from datautils.dataset_enum import get_dataset_enum
 from models.utils.ssl_method_enum import SSL_Method
-from optim.optimizer import SwAVScheduler, load_optimizer
+from optim.optimizer import load_optimizer
 import utils.logger as logging
 from typing import List
-import copy
 import random
 
 from datautils.path_loss import PathLoss
 from datautils.target_dataset import get_target_pretrain_ds
 from models.active_learning.pretext_dataloader import PretextDataLoader
+from models.active_learning.rotation import rotate_batch
+from models.active_learning.selection import select_indices
 from models.backbones.resnet import resnet_backbone
+from models.trainers.engine import TrainingEngine
 
 from models.utils.commons import AverageMeter, get_ds_num_classes, get_feature_dimensions_backbone, get_model_criterion, get_params
 from models.utils.training_type_enum import TrainingType
 from models.active_learning.al_method_enum import AL_Method, get_al_method_enum
-from utils.commons import load_chkpts, load_path_loss, load_saved_state, save_accuracy_to_file, save_path_loss, simple_load_model, simple_save_model
+from utils.best_weights import BestWeights
+from utils.precision import MixedPrecision
+from utils.checkpointing import CheckpointManager
+from utils.device import cpu_autocast, prepare_model, to_device
+from utils.commons import load_chkpts, load_path_loss, load_saved_state, save_accuracy_to_file, save_path_loss, simple_load_model, simple_save_model, write_path_loss
 
 class PretextTrainer():
     def __init__(self, args, writer) -> None:
@@ -32,8 +38,11 @@ class PretextTrainer():
         self.best_trainer_acc = 0
         self.val_acc_history = []
         self.best_model = None
+        self.proxy_checkpoints = CheckpointManager(
+            self.args, self.args.model_checkpoint_path, save_every=0, best_filename='proxy_{}.pth')
 
         self.num_classes, self.dir = get_ds_num_classes(self.args.target_dataset)
+        self.precision = MixedPrecision(self.args)
         self.n_features = get_feature_dimensions_backbone(self.args)
 
     def eval_main_task(self, model, epoch, criterion, batch, test_loader):
@@ -43,7 +52,7 @@ class PretextTrainer():
         model.eval()
         correct, total = 0, 0
 
-        end = time.time()
+        end = time.perf_counter()
         with torch.no_grad():
             for step, (inputs, targets) in enumerate(test_loader):
                 inputs, targets = inputs.to(self.args.device), targets.to(self.args.device)
@@ -52,20 +61,20 @@ class PretextTrainer():
 
                 _, predicted = outputs.max(1)
                 total += targets.size(0)
-                correct += predicted.eq(targets).sum().item()
+                correct += predicted.eq(targets).sum()
 
-                losses.update(loss.item(), inputs[0].size(0))
+                losses.update(loss, inputs[0].size(0))
                 
                 # measure elapsed time
                 batch_time.update(time.perf_counter() - end)
                 end = time.perf_counter()
 
-        epoch_acc = 100. * correct / total
+        epoch_acc = 100. * float(correct) / total
         
-        # Save checkpoint.
+        # Save checkpoint, only the one of the best batch is kept on disk
         self.val_acc_history.append(str(epoch_acc))
         if epoch_acc > self.best_proxy_acc:
-            simple_save_model(self.args, model, f'proxy_{batch}.pth')
+            self.proxy_checkpoints.step(batch, epoch_acc, model=model)
             self.best_proxy_acc = epoch_acc
             self.best_batch = batch
 
@@ -78,47 +87,14 @@ class PretextTrainer():
                 batch_time=batch_time, loss=losses, top1=epoch_acc, acc=self.best_proxy_acc))
 
     def train_main_task(self, model, epoch, criterion, optimizer, train_params, train_loader):
-        batch_time = AverageMeter()
-        data_time = AverageMeter()
-        losses = AverageMeter()
+        def compute_loss(batch, epoch, step):
+            inputs, targets = batch
+
+            with self.precision.autocast():
+                outputs = model(inputs)
+            return criterion(outputs.float(), targets)
 
-        model.train()
-        end = time.time()
-
-        total_loss, total_num = 0.0, 0
-        for step, (inputs, targets) in enumerate(train_loader):
-            inputs, targets = inputs.to(self.args.device), targets.to(self.args.device)
-            
-            optimizer.zero_grad()
-            outputs = model(inputs)
-
-            loss = criterion(outputs, targets)
-            
-            loss.backward()
-            optimizer.step()
-
-            total_num += train_params.batch_size
-            total_loss += loss.item() * train_params.batch_size
-
-            losses.update(loss.item(), inputs[0].size(0))
-            batch_time.update(time.time() - end)
-            end = time.time()
-
-            if step % self.args.log_step == 0:
-                logging.info(
-                    "Epoch: [{0}][{1}]\t"
-                    "Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t"
-                    "Data {data_time.val:.3f} ({data_time.avg:.3f})\t"
-                    "Loss {loss.val:.4f} ({loss.avg:.4f})\t"
-                    "Lr: {lr:.4f}".format(
-                        epoch,
-                        step,
-                        batch_time=batch_time,
-                        data_time=data_time,
-                        loss=losses,
-                        lr=optimizer.param_groups[0]["lr"],
-                    )
-                )
+        return TrainingEngine(self.args, model, optimizer, self.precision).train_epoch(train_loader, epoch, compute_loss)
 
     def main_task(self, samples, model, batch, rebuild_al_model=False):
         train_loader = PretextDataLoader(self.args, samples, is_val=False, batch_size=self.args.al_maintask_batch_size).get_loader()
@@ -151,154 +127,121 @@ class PretextTrainer():
 
         return model
 
-    def batch_sampler(self, model, samples: List[PathLoss]) -> List[PathLoss]:
-        loader = PretextDataLoader(self.args, samples, is_val=True, batch_size=1).get_loader()
+    def batch_sampler(self, model, samples: List[PathLoss], k=None, most_certain=False) -> np.ndarray:
+        """
+        Scores `samples` with the model and returns the indices of the k most uncertain of them,
+        most uncertain first, or of the k most certain ones, most certain first. The logits of
+        the whole pool are kept in a buffer on the device and only the selected indices are
+        copied back.
+        """
+        loader = PretextDataLoader(self.args, samples, is_val=True, batch_size=self.args.al_sampler_batch_size).get_loader()
 
         logging.info(f"Generating the top1 scores using {get_al_method_enum(self.args.al_method_)}")
-        _preds = []
+        logits = None
+        offset = 0
 
         model.eval()
         with torch.no_grad():
-            for step, (inputs, targets) in enumerate(loader):
-                inputs, targets = inputs.to(self.args.device), targets.to(self.args.device)
-                outputs = model(inputs)
+            for step, (inputs, _) in enumerate(loader):
+                with cpu_autocast(self.args):
+                    outputs = model(to_device(self.args, inputs)).float()
 
-                _preds.append(self.get_predictions(outputs))
+                if logits is None:
+                    logits = torch.empty(len(loader.dataset), outputs.size(1), device=outputs.device)
+                logits[offset: offset + outputs.size(0)] = outputs
+                offset += outputs.size(0)
 
                 if step % self.args.log_step == 0:
                     logging.info(f"Eval Step [{step}/{len(loader)}]")
 
-        preds = torch.cat(_preds).numpy()
-       
-        return self.get_new_samples(preds, samples)
-
-    def get_predictions(self, outputs):
-        dist1 = F.softmax(outputs, dim=1)
-        preds = dist1.detach().cpu()
-
-        return preds
-
-    def get_new_samples(self, preds, samples) -> List[PathLoss]:
-        if self.args.al_method_ == AL_Method.LEAST_CONFIDENCE.value:
-            probs = preds.max(axis=1)
-            indices = probs.argsort(axis=0)
+        k = len(samples) if k is None else k
+        return select_indices(logits, k, self.args.al_method_, most_certain)
+
+    def stack_rotations(self, images):
+        """
+        Moves a batch of images to the device and builds its four rotated views and labels as
+        single (4B, ...) tensors, so they take one forward. The criterion mean over the 4B
+        samples equals the average of the four per-rotation means.
+        """
+        return rotate_batch(to_device(self.args, images))
+
+    def get_rotation_losses(self, model, loader):
+        """
+        Scores every image of the loader with its rotation pretext loss. The four rotations of
+        a whole batch go through the model in one forward pass and the per-sample losses are
+        written into a preallocated array, so there is a single host sync per batch.
+        """
+        losses = np.empty(len(loader.dataset), dtype=np.float32)
+        paths = []
+        offset = 0
 
-        elif self.args.al_method_ == AL_Method.ENTROPY.value:
-            entropy = (np.log(preds) * preds).sum(axis=1) * -1.
-            indices = entropy.argsort(axis=0)[::-1]
-
-        elif self.args.al_method_ == AL_Method.BOTH.value:
-            probs = preds.max(axis=1)
-            indices1 = probs.argsort(axis=0)
-
-            entropy = (np.log(preds) * preds).sum(axis=1) * -1.
-            indices2 = entropy.argsort(axis=0)[::-1]
-
-            indices = np.concatenate((indices1, indices2)) 
-            random.shuffle(indices)
-            indices = indices[: (len(indices)//2)]
-
-        else:
-            raise ValueError(f"'{self.args.al_method_}' method doesn't exist")
+        with torch.no_grad():
+            for step, (inputs, path) in enumerate(loader):
+                bs = inputs.size(0)
+                images, labels = self.stack_rotations(inputs)
+
+                # mean over the four rotations of each image
+                with cpu_autocast(self.args):
+                    outputs = model(images).float()
+                loss = F.cross_entropy(outputs, labels, reduction='none').view(4, bs).mean(dim=0)
+                losses[offset: offset + bs] = loss.cpu().numpy()
+                paths.extend(path)
+                offset += bs
 
-        new_samples = []
-        for item in indices:
-            new_samples.append(samples[item]) # Map back to original indices
+                if step % self.args.log_step == 0:
+                    logging.info(f"Eval Step [{step}/{len(loader)}]\t Loss: {losses[offset - bs: offset].mean()}")
 
-        return new_samples
+        return paths, losses
 
     def make_batches(self, model):
-        loader = get_target_pretrain_ds(self.args, training_type=TrainingType.ACTIVE_LEARNING, is_train=False, batch_size=1).get_loader()
+        loader = get_target_pretrain_ds(
+            self.args, training_type=TrainingType.ACTIVE_LEARNING, 
+            is_train=False, batch_size=self.args.al_scoring_batch_size).get_loader()
 
         model, criterion = get_model_criterion(self.args, model, num_classes=4)
         state = simple_load_model(self.args, path='finetuner.pth')
         model.load_state_dict(state['model'], strict=False)
-        model = model.to(self.args.device)
+        model = prepare_model(self.args, model)
 
         model.eval()
 
-        test_loss = 0
-        correct = 0
-        total = 0
-        pathloss = []
-
         logging.info("About to begin eval to make batches")
-        with torch.no_grad():
-            for step, (inputs, inputs1, inputs2, inputs3, targets, targets1, targets2, targets3, path) in enumerate(loader):
-                inputs, inputs1, targets, targets1 = inputs.to(self.args.device), inputs1.to(self.args.device), targets.to(self.args.device), targets1.to(self.args.device)
-                inputs2, inputs3, targets2, targets3 = inputs2.to(self.args.device), inputs3.to(self.args.device), targets2.to(self.args.device), targets3.to(self.args.device)
-                outputs = model(inputs)
-                outputs1 = model(inputs1)
-                outputs2 = model(inputs2)
-                outputs3 = model(inputs3)
-                loss1 = criterion(outputs, targets)
-                loss2 = criterion(outputs1, targets1)
-                loss3 = criterion(outputs2, targets2)
-                loss4 = criterion(outputs3, targets3)
-                loss = (loss1+loss2+loss3+loss4)/4.
-                test_loss += loss.item()
-                _, predicted = outputs.max(1)
-                total += targets.size(0)
-                correct += predicted.eq(targets).sum().item()
-
-                loss = loss.item()
-
-                if step % self.args.log_step == 0:
-                    logging.info(f"Eval Step [{step}/{len(loader)}]\t Loss: {loss}")
+        paths, losses = self.get_rotation_losses(model, loader)
 
-                pathloss.append(PathLoss(path, loss))
-        
-        sorted_samples = sorted(pathloss, key=lambda x: x.loss, reverse=True)
-        save_path_loss(self.args, self.args.al_path_loss_file, sorted_samples)
-
-        return sorted_samples
+        # a stable sort keeps ties in loader order, the same as sorted(..., reverse=True) did
+        indices = np.argsort(-losses, kind='stable')
+        return write_path_loss(self.args, self.args.al_path_loss_file, [paths[i] for i in indices], losses[indices])
 
     def eval_finetuner(self, model, criterion, test_loader):
         batch_time = AverageMeter()
         losses = AverageMeter()
 
         model.eval()
-        end = time.time()
+        end = time.perf_counter()
         total, correct = 0, 0
 
         with torch.no_grad():
-            for step, (inputs, inputs1, inputs2, inputs3, targets, targets1, targets2, targets3) in enumerate(test_loader):
-                inputs, inputs1, targets, targets1 = inputs.to(self.args.device), inputs1.to(self.args.device), targets.to(self.args.device), targets1.to(self.args.device)
-                inputs2, inputs3, targets2, targets3 = inputs2.to(self.args.device), inputs3.to(self.args.device), targets2.to(self.args.device), targets3.to(self.args.device)
-                
-                outputs = model(inputs)
-                outputs1 = model(inputs1)
-                outputs2 = model(inputs2)
-                outputs3 = model(inputs3)
+            for step, images in enumerate(test_loader):
+                inputs, targets = self.stack_rotations(images)
 
-                loss = criterion(outputs, targets)
-                loss1 = criterion(outputs1, targets1)
-                loss2 = criterion(outputs2, targets2)
-                loss3 = criterion(outputs3, targets3)
-                loss_avg = (loss + loss1 + loss2 + loss3) / 4.
+                outputs = model(inputs)
+                loss_avg = criterion(outputs, targets)
 
                 _, predicted = outputs.max(1)
-                _, predicted1 = outputs1.max(1)
-                _, predicted2 = outputs2.max(1)
-                _, predicted3 = outputs3.max(1)
-                total += targets.size(0)*4
-
-                correct += predicted.eq(targets).sum().item()
-                correct += predicted1.eq(targets1).sum().item()
-                correct += predicted2.eq(targets2).sum().item()
-                correct += predicted3.eq(targets3).sum().item()
+                total += targets.size(0)
+                correct += predicted.eq(targets).sum()
 
-                losses.update(loss_avg.item(), inputs[0].size(0))
+                losses.update(loss_avg, inputs[0].size(0))
                 
                 # measure elapsed time
                 batch_time.update(time.perf_counter() - end)
                 end = time.perf_counter()
 
         # Save checkpoint.
-        epoch_acc = 100. * correct / total
+        epoch_acc = 100. * float(correct) / total
 
         if epoch_acc > self.best_trainer_acc:
-            self.best_model = copy.deepcopy(model)
+            self.best_model.update(model)
             self.best_trainer_acc = epoch_acc
 
         logging.info(
@@ -311,51 +254,20 @@ class PretextTrainer():
 
 
     def train_finetuner(self, model, epoch, criterion, optimizer, scheduler, train_loader):
-        batch_time = AverageMeter()
-        data_time = AverageMeter()
-        losses = AverageMeter()
-
-        model.train()
-        end = time.time()
-        for step, (inputs, inputs1, inputs2, inputs3, targets, targets1, targets2, targets3) in enumerate(train_loader):
-            
+        def before_step(epoch, step):
             # update learning rate
             if self.args.al_optimizer == "SwAV":
                 scheduler.step(epoch, step)
 
-            inputs, inputs1 = inputs.to(self.args.device), inputs1.to(self.args.device)
-            targets, targets1 = targets.to(self.args.device), targets1.to(self.args.device)
-            inputs2, inputs3 = inputs2.to(self.args.device), inputs3.to(self.args.device)
-            targets2, targets3 = targets2.to(self.args.device), targets3.to(self.args.device)
-
-            optimizer.zero_grad()
-            outputs, outputs1, outputs2, outputs3 = model(inputs), model(inputs1), model(inputs2), model(inputs3)
-
-            loss = criterion(outputs, targets)
-            loss1 = criterion(outputs1, targets1)
-            loss2 = criterion(outputs2, targets2)
-            loss3 = criterion(outputs3, targets3)
-            loss_avg = (loss + loss1 + loss2 + loss3) / 4.
-            loss_avg.backward()
-            optimizer.step()
-
-            losses.update(loss_avg.item(), inputs[0].size(0))
-            batch_time.update(time.time() - end)
-            end = time.time()
-
-            if step % self.args.log_step == 0:
-                logging.info(
-                    "Epoch: [{0}][{1}]\t"
-                    "Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t"
-                    "Data {data_time.val:.3f} ({data_time.avg:.3f})\t"
-                    "Loss {loss.val:.4f} ({loss.avg:.4f})\t"
-                    "Lr: {lr:.4f}".format(
-                        epoch, step,
-                        batch_time=batch_time,
-                        data_time=data_time,
-                        loss=losses, lr=optimizer.param_groups[0]["lr"],
-                    )
-                )
+        def compute_loss(images, epoch, step):
+            inputs, targets = self.stack_rotations(images)
+
+            with self.precision.autocast():
+                outputs = model(inputs)
+            return criterion(outputs.float(), targets)
+
+        return TrainingEngine(self.args, model, optimizer, self.precision).train_epoch(
+            train_loader, epoch, compute_loss, before_step=before_step)
 
     def finetuner(self, model):
         train_loader, test_loader = get_target_pretrain_ds(
@@ -386,6 +298,7 @@ class PretextTrainer():
             state, train_params,
             train_loader=train_loader)
 
+        self.best_model = BestWeights(model)
         for epoch in range(self.args.al_finetune_trainer_epochs):
             logging.info('\nEpoch {}/{}'.format(epoch, self.args.al_finetune_trainer_epochs))
             logging.info('-' * 20)
@@ -401,7 +314,7 @@ class PretextTrainer():
 
 
     def do_active_learning(self) -> List[PathLoss]:
-        encoder = resnet_backbone(self.args.backbone, pretrained=False)
+        encoder = resnet_backbone(self.args.backbone, pretrained=False, cached=True)
         
         main_task_model = encoder
 
@@ -418,13 +331,13 @@ class PretextTrainer():
             model, _ = get_model_criterion(self.args, encoder, num_classes=4)
             state = simple_load_model(self.args, path='finetuner.pth')
             model.load_state_dict(state['model'], strict=False)
-            model = model.to(self.args.device)
-
-            samplek = self.batch_sampler(model, path_loss)
+            model = prepare_model(self.args, model)
 
             # this does a reverse active learning to pick only the most certain data
-            samplek = samplek[::-1]
-            return samplek[: int(len(samplek) * self.args.al_sample_percentage)]
+            indices = self.batch_sampler(
+                model, path_loss, 
+                k=int(len(path_loss) * self.args.al_sample_percentage), most_certain=True)
+            return [path_loss[i] for i in indices]
 
         pretraining_sample_pool = []
         rebuild_al_model = True
@@ -440,7 +353,8 @@ class PretextTrainer():
                 main_task_model.load_state_dict(state['model'], strict=False)
 
                 # sampling
-                samplek = self.batch_sampler(main_task_model, sample6400)[:self.args.al_trainer_sample_size]
+                indices = self.batch_sampler(main_task_model, sample6400, k=self.args.al_trainer_sample_size)
+                samplek = [sample6400[i] for i in indices]
             else:
                 # first iteration: sample k at even intervals
                 samplek = sample6400[:self.args.al_trainer_sample_size]
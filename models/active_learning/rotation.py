@@ -0,0 +1,28 @@
+'''
+Batched generation of the 4-way rotation pretext task.
+
+The datasets ship one image per sample; the four rotations and their labels are built here
+for the whole batch on the training device, instead of as four tensors per sample in the
+DataLoader workers.
+'''
+
+import torch
+
+
+def rotate_batch(images, shuffle=True):
+    """
+    Returns the four rotations of a (B, C, H, W) batch of square images stacked into a
+    (4B, C, H, W) tensor, with their rotation labels. Like the per-sample datasets did, the
+    order of the rotations in the four slots of every image is shuffled independently.
+    """
+    bs = images.size(0)
+    rotations = torch.stack([torch.rot90(images, k, [2, 3]) for k in range(4)])
+
+    if shuffle:
+        # an independent random permutation of the four rotations for every image
+        labels = torch.rand(bs, 4, device=images.device).argsort(dim=1).t()
+    else:
+        labels = torch.arange(4, device=images.device).unsqueeze(1).expand(4, bs)
+
+    views = rotations[labels, torch.arange(bs, device=images.device)]
+    return views.flatten(0, 1), labels.reshape(-1)
@@ -0,0 +1,58 @@
+'''
+Selection of the samples picked by the active learning strategies.
+
+Only the k requested samples are ever ranked: the top-k are found on the device with a partial
+selection (torch.topk), which is linear in the pool size, and the selections are returned as
+index arrays for the callers to map back to their samples.
+'''
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from models.active_learning.al_method_enum import AL_Method
+
+
+def get_uncertainty(logits, method):
+    """Per-sample uncertainty of the softmax over `logits`, higher is more uncertain"""
+    log_probs = F.log_softmax(logits.float(), dim=1)
+
+    if method == AL_Method.LEAST_CONFIDENCE.value:
+        return 1. - log_probs.max(dim=1)[0].exp()
+
+    elif method == AL_Method.ENTROPY.value:
+        return -(log_probs.exp() * log_probs).sum(dim=1)
+
+    raise ValueError(f"'{method}' method doesn't exist")
+
+
+def top_k_indices(scores, k, largest=True):
+    """Indices of the k largest (or smallest) scores, best first"""
+    return torch.topk(scores, k, largest=largest).indices
+
+
+def select_indices(logits, k, method, most_certain=False):
+    """
+    Returns the indices of the k most uncertain samples, most uncertain first, or of the k most
+    certain ones, most certain first. In BOTH mode k samples are drawn at random from the union
+    of the least confidence and the entropy selections.
+    """
+    k = min(k, len(logits))
+    if k == 0:
+        return np.empty(0, dtype=np.int64)
+
+    largest = not most_certain
+    if method in [AL_Method.LEAST_CONFIDENCE.value, AL_Method.ENTROPY.value]:
+        indices = top_k_indices(get_uncertainty(logits, method), k, largest)
+
+    elif method == AL_Method.BOTH.value:
+        indices1 = top_k_indices(get_uncertainty(logits, AL_Method.LEAST_CONFIDENCE.value), k, largest)
+        indices2 = top_k_indices(get_uncertainty(logits, AL_Method.ENTROPY.value), k, largest)
+
+        indices = torch.unique(torch.cat((indices1, indices2)))
+        indices = indices[torch.randperm(len(indices), device=indices.device)[:k]]
+
+    else:
+        raise ValueError(f"'{method}' method doesn't exist")
+
+    return indices.cpu().numpy()
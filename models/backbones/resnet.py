@@ -1,3 +1,4 @@
+import copy
 import torchvision
 
 '''ResNet in PyTorch.
@@ -113,14 +114,52 @@ def resnet50():
     return ResNet(Bottleneck, [3, 4, 6, 3])
 
 
-def resnet_backbone(name, pretrained=False):
-    # weights18 = torchvision.models.resnet.ResNet18_Weights.DEFAULT if pretrained else None
-    # weights50 = torchvision.models.resnet.ResNet50_Weights.DEFAULT if pretrained else None
+BACKBONES = {
+    "resnet18": torchvision.models.resnet18,
+    "resnet50": torchvision.models.resnet50,
+}
 
-    resnets = {
-        "resnet18": torchvision.models.resnet18(pretrained=pretrained),#weights=weights18),
-        "resnet50": torchvision.models.resnet50(pretrained=pretrained),#weights=weights50),
-    }
-    if name not in resnets.keys():
+# CPU-resident templates of the backbones built so far, keyed on (name, pretrained)
+_templates = {}
+
+
+def register_backbone(name, builder):
+    BACKBONES[name] = builder
+
+
+def reset_parameters(model):
+    """Draws new random weights, with the initialization of the torchvision ResNets"""
+    for m in model.modules():
+        if isinstance(m, nn.Conv2d):
+            nn.init.kaiming_normal_(m.weight, mode="fan_out", nonlinearity="relu")
+        elif isinstance(m, (nn.BatchNorm2d, nn.GroupNorm)):
+            nn.init.constant_(m.weight, 1)
+            nn.init.constant_(m.bias, 0)
+        elif isinstance(m, nn.Linear):
+            m.reset_parameters()
+
+    return model
+
+
+def resnet_backbone(name, pretrained=False, cached=False):
+    """
+    Builds only the requested backbone. With `cached`, the backbone is built once per process
+    and later calls return a deep copy of that CPU template, which is much cheaper than
+    allocating and initializing a fresh ResNet. Copies of a backbone that isn't pretrained get
+    new random weights, so every model of a process still starts from its own initialization.
+    """
+    if name not in BACKBONES:
         raise KeyError(f"{name} is not a valid ResNet version")
-    return resnets[name]
+
+    if not cached:
+        return BACKBONES[name](pretrained=pretrained)
+
+    key = (name, pretrained)
+    if key not in _templates:
+        _templates[key] = BACKBONES[name](pretrained=pretrained)
+
+    model = copy.deepcopy(_templates[key])
+    if not pretrained:
+        reset_parameters(model)
+
+    return model
@@ -25,9 +25,9 @@ class NT_Xent(nn.Module):
         N = 2 * batch_size * world_size
         mask = torch.ones((N, N), dtype=bool)
         mask = mask.fill_diagonal_(0)
-        for i in range(batch_size * world_size):
-            mask[i, batch_size * world_size + i] = 0
-            mask[batch_size * world_size + i, i] = 0
+        index = torch.arange(batch_size * world_size)
+        mask[index, batch_size * world_size + index] = 0
+        mask[batch_size * world_size + index, index] = 0
         return mask
 
     def forward(self, z_i, z_j):
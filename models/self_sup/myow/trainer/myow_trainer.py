@@ -1,4 +1,3 @@
-import time
 import utils.logger as logging
 from sched import scheduler
 import numpy as np
@@ -12,15 +11,17 @@ from models.self_sup.myow.model.mlp3 import MLP3
 from models.self_sup.myow.trainer.byol_trainer import BYOLTrainer
 from models.self_sup.myow.transformation.transformations import TransformsMYOW
 from optim.optimizer import load_optimizer
-from models.utils.commons import AverageMeter, get_params
+from models.utils.commons import get_params
+from models.trainers.engine import TrainingEngine
 from models.utils.training_type_enum import TrainingType
 from utils.commons import load_saved_state
+from utils.precision import MixedPrecision
 
 
 class MYOWTrainer(BYOLTrainer):
     def __init__(self, args, writer, encoder, trainingType, pretrain_level, rebuild_al_model=False, train_dataloader=None, view_pool_dataloader=None, 
                 transform=None, transform_m=None, view_miner_k=4, decay='cosine', n_decay=1.5, m_decay='cosine', exclude_bias_and_bn=False, 
-                symmetric_loss=True, log_step=0, untransform_vis=None):
+                symmetric_loss=True, log_step=0, log_img_step=0, untransform_vis=None):
 
         self.args = args
         self.writer = writer
@@ -118,12 +119,15 @@ class MYOWTrainer(BYOLTrainer):
             params = self.model.parameters()
 
         self.optimizer, self.scheduler = load_optimizer(self.args, params, state, self.train_params)
+        self.precision = MixedPrecision(self.args)
+        self.engine = TrainingEngine(self.args, self.model, self.optimizer, self.precision, log_step=log_step)
 
         self.loss = CosineLoss().to(self.device)
         self.symmetric_loss = symmetric_loss
 
         # logging
         self.log_step = log_step
+        self.log_img_step = log_img_step
 
     def build_model(self, encoder):
         projector_1 = MLP3(self.representation_size, self.projection_size, self.projection_hidden_size)
@@ -162,84 +166,80 @@ class MYOWTrainer(BYOLTrainer):
         return outputs
 
     def train_epoch(self, epoch):
-        batch_time = AverageMeter()
-        data_time = AverageMeter()
-        losses = AverageMeter()
-
-        self.model.train()
-        end = time.time()
-
         if self.view_pool_dataloader is not None:
-            view_pooler = iter(self.view_pool_dataloader)
-        for inputs in self.train_dataloader:
-            # update parameters
-            self.update_learning_rate(self.step)
-            self.update_momentum(self.step)
-            self.update_mined_loss_weight(self.step)
-
-            # Clear gradients w.r.t. parameters
-            self.optimizer.zero_grad()
-
-            inputs = self.prepare_views(inputs) # outputs view1 and view2 (pre-gpu-transform)
-            view1 = inputs['view1'].to(self.device)
-            view2 = inputs['view2'].to(self.device)
-
-            if self.transform_1 is not None:
-                # apply transforms
-                view1 = self.transform_1(view1)
-                view2 = self.transform_2(view2)
-
-            # Forward pass to get output/logits
+            self.view_pooler = iter(self.view_pool_dataloader)
+
+        return self.engine.train_epoch(
+            self.train_dataloader, epoch, self.compute_loss,
+            before_step=self.before_step,
+            after_step=self.after_step,
+            step_offset=self.step)
+
+    def before_step(self, epoch, step):
+        # update parameters
+        self.update_learning_rate(self.step)
+        self.update_momentum(self.step)
+        self.update_mined_loss_weight(self.step)
+
+    def next_view_pool(self):
+        try:
+            # currently only supports img, label
+            view_pool, label_pool = next(self.view_pooler)
+        except StopIteration:
+            # reinit the dataloader
+            self.view_pooler = iter(self.view_pool_dataloader)
+            view_pool, label_pool = next(self.view_pooler)
+
+        return view_pool.to(self.device).squeeze()
+
+    def compute_loss(self, inputs, epoch, step):
+        """
+        The symmetric and the mined losses are summed into one loss, so the step takes a
+        single backward pass with the same gradients as one backward per loss.
+        """
+        inputs = self.prepare_views(inputs) # outputs view1 and view2 (pre-gpu-transform)
+        view1 = inputs['view1'].to(self.device)
+        view2 = inputs['view2'].to(self.device)
+
+        if self.transform_1 is not None:
+            # apply transforms
+            view1 = self.transform_1(view1)
+            view2 = self.transform_2(view2)
+
+        # Forward pass to get output/logits
+        with self.precision.autocast():
             outputs = self.model({'online_view': view1, 'target_view':view2})
-            weight = 1 / (1. + self.mined_loss_weight)
-            if self.symmetric_loss:
-                weight /= 2.
+        weight = 1 / (1. + self.mined_loss_weight)
+        if self.symmetric_loss:
+            weight /= 2.
 
-            # Calculate Loss: softmax --> cross entropy loss
-            loss = weight * self.forward_loss(outputs['online_q'], outputs['target_z'])
+        # Calculate Loss: softmax --> cross entropy loss
+        loss = weight * self.forward_loss(outputs['online_q'].float(), outputs['target_z'].float())
 
-            # Getting gradients w.r.t. parameters
-            if self.mined_loss_weight > 0 and not self.symmetric_loss:
-                with self.model.no_sync():
-                    loss.backward()
+        if self.symmetric_loss:
+            with self.precision.autocast():
+                outputs = self.model({'online_view': view2, 'target_view': view1})
+            weight = 1 / (1. + self.mined_loss_weight) / 2.
+            loss = loss + weight * self.forward_loss(outputs['online_q'].float(), outputs['target_z'].float())
+
+        # mine view
+        if self.mined_loss_weight > 0:
+            if self.view_pool_dataloader is not None:
+                view_pool = self.next_view_pool()
+                view3 = inputs['view1'].to(self.device)
             else:
-                loss.backward()
+                view3 = inputs['view3'].to(self.device).squeeze() \
+                    if 'view3' in inputs else inputs['view1'].to(self.device).squeeze()
+                view_pool = inputs['view_pool'].to(self.device).squeeze()
 
-            if self.symmetric_loss:
-                outputs = self.model({'online_view': view2, 'target_view': view1})
-                weight = 1 / (1. + self.mined_loss_weight) / 2.
-                loss = weight * self.forward_loss(outputs['online_q'], outputs['target_z'])
-                if self.mined_loss_weight > 0:
-                    with self.model.no_sync():
-                        loss.backward()
-                else:
-                    loss.backward()
-
-            # mine view
-            if self.mined_loss_weight > 0:
-                if self.view_pool_dataloader is not None:
-                    try:
-                        # currently only supports img, label
-                        view_pool, label_pool = next(view_pooler)
-                        view_pool = view_pool.to(self.device).squeeze()
-                    except StopIteration:
-                        # reinit the dataloader
-                        view_pooler = iter(self.view_pool_dataloader)
-                        view_pool, label_pool = next(view_pooler)
-                        view_pool = view_pool.to(self.device).squeeze()
-                    view3 = inputs['view1'].to(self.device)
-                else:
-                    view3 = inputs['view3'].to(self.device).squeeze() \
-                        if 'view3' in inputs else inputs['view1'].to(self.device).squeeze()
-                    view_pool = inputs['view_pool'].to(self.device).squeeze()
-
-                # apply transform
-                if self.transform_m is not None:
-                    # apply transforms
-                    view3 = self.transform_m(view3)
-                    view_pool = self.transform_m(view_pool)
-
-                # compute representations
+            # apply transform
+            if self.transform_m is not None:
+                # apply transforms
+                view3 = self.transform_m(view3)
+                view_pool = self.transform_m(view_pool)
+
+            # compute representations
+            with self.precision.autocast():
                 outputs = self.model({'online_view': view3}, get_embedding='encoder')
                 online_y = outputs['online_y']
                 outputs_pool = self.model({'target_view': view_pool}, get_embedding='encoder')
@@ -250,49 +250,27 @@ class MYOWTrainer(BYOLTrainer):
 
                 target_y_mined = target_y_pool[selection_mask].contiguous()
                 outputs_mined = self.model({'online_y': online_y,'target_y': target_y_mined}, get_embedding='predictor_m')
-                weight = self.mined_loss_weight / (1. + self.mined_loss_weight)
-                loss = weight * self.forward_loss(outputs_mined['online_q_m'], outputs_mined['target_v'])
-                loss.backward()
-
-            # Updating parameters
-            self.optimizer.step()
-
-            # update moving average
-            self.update_target_network()
+            weight = self.mined_loss_weight / (1. + self.mined_loss_weight)
+            loss = loss + weight * self.forward_loss(outputs_mined['online_q_m'].float(), outputs_mined['target_v'].float())
 
-            losses.update(loss.item(), inputs[0].size(0))
-            batch_time.update(time.time() - end)
-            end = time.time()
+            self.mined_views = (view3, view_pool[selection_mask])
 
-            # log
-            if self.step % self.log_step == 0:
-                logging.info(
-                    "Epoch: [{0}][{1}]\t"
-                    "Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t"
-                    "Data {data_time.val:.3f} ({data_time.avg:.3f})\t"
-                    "Loss {loss.val:.4f} ({loss.avg:.4f})\t"
-                    "Lr: {lr:.4f}".format(
-                        epoch,
-                        self.step,
-                        batch_time=batch_time,
-                        data_time=data_time,
-                        loss=losses,
-                        lr=self.optimizer.param_groups[0]["lr"],
-                    )
-                )
+        return loss
 
-            # log images
-            if self.mined_loss_weight > 0 and self.log_img_step > 0 and self.step % self.log_img_step == 0 and self.rank == 0:
-                self.log_correspondance(view3, view_pool[selection_mask])
+    def after_step(self, epoch, step, loss):
+        # update moving average
+        self.update_target_network()
 
-            # update parameters
-            self.step += 1
+        # log images
+        if self.mined_loss_weight > 0 and self.log_img_step > 0 and self.step % self.log_img_step == 0 and self.args.rank == 0:
+            self.log_correspondance(*self.mined_views)
 
-        return losses.avg
+        # update parameters
+        self.step += 1
 
 
 
-def get_myow_trainer(args, writer, encoder, dataloader, pretrain_level, rebuild_al_model=False, trainingType=TrainingType.BASE_PRETRAIN):
+def get_myow_trainer(args, writer, encoder, dataloader, pretrain_level, rebuild_al_model=False, trainingType=TrainingType.BASE_PRETRAIN, log_step=500):
     params = get_params(args, trainingType)
 
     transformMYOW = TransformsMYOW(params.image_size)
@@ -302,6 +280,6 @@ def get_myow_trainer(args, writer, encoder, dataloader, pretrain_level, rebuild_
                         train_dataloader=dataloader, view_pool_dataloader=dataloader, transform=transform,
                         transform_m=transform_m, exclude_bias_and_bn=True, 
                         symmetric_loss=True, view_miner_k=1,
-                        decay='cosine', m_decay='cosine', log_step=500)
+                        decay='cosine', m_decay='cosine', log_step=log_step)
 
     return trainer
\ No newline at end of file
@@ -0,0 +1,56 @@
+'''
+Blockwise log-sum-exp over the similarity matrix of a contrastive loss.
+
+The denominators of NT-Xent and DCL are row-wise log-sum-exps of anchor @ contrast.T / t with a
+few columns left out (the anchor itself, its positives). Here they are computed over
+chunk_size x chunk_size blocks with an online log-sum-exp, and the left out columns are given
+as offsets from the row index, so neither the dense similarity matrix nor a mask is ever built.
+With checkpointing the blocks of a row chunk are recomputed in the backward pass instead of
+being kept alive, so the memory no longer grows with the square of the batch size.
+'''
+
+import torch
+from torch.utils.checkpoint import checkpoint
+
+
+def _chunk_logsumexp(anchor, contrast, row_start, temperature, exclude_offsets, chunk_size):
+    n = contrast.size(0)
+    rows = torch.arange(row_start, row_start + anchor.size(0), device=anchor.device)
+
+    running_max = torch.full((anchor.size(0),), float("-inf"), device=anchor.device, dtype=anchor.dtype)
+    running_sum = torch.zeros(anchor.size(0), device=anchor.device, dtype=anchor.dtype)
+
+    for col_start in range(0, n, chunk_size):
+        block = torch.mm(anchor, contrast[col_start: col_start + chunk_size].t()) / temperature
+
+        for offset in exclude_offsets:
+            cols = (rows + offset) % n - col_start
+            inside = (cols >= 0) & (cols < block.size(1))
+            block = block.index_put(
+                (torch.nonzero(inside).squeeze(1), cols[inside]),
+                torch.tensor(float("-inf"), device=block.device, dtype=block.dtype))
+
+        # rows whose columns were all left out so far keep a -inf max, shift those by 0
+        new_max = torch.maximum(running_max, block.max(dim=1)[0]).detach()
+        shift = new_max.masked_fill(torch.isinf(new_max), 0)
+        running_sum = running_sum * torch.exp(running_max - shift) + torch.exp(block - shift.unsqueeze(1)).sum(dim=1)
+        running_max = new_max
+
+    return running_max + torch.log(running_sum)
+
+
+def contrastive_logsumexp(anchor, contrast, temperature, exclude_offsets=(0,), chunk_size=256, use_checkpoint=False):
+    """
+    Returns, for every row i of `anchor`, the log-sum-exp of anchor[i] @ contrast.T / temperature
+    over every column except (i + offset) % len(contrast) for each of `exclude_offsets`.
+    """
+    out = []
+    for row_start in range(0, anchor.size(0), chunk_size):
+        args = (anchor[row_start: row_start + chunk_size], contrast, row_start, temperature, exclude_offsets, chunk_size)
+
+        if use_checkpoint and torch.is_grad_enabled():
+            out.append(checkpoint(_chunk_logsumexp, *args, use_reentrant=False))
+        else:
+            out.append(_chunk_logsumexp(*args))
+
+    return torch.cat(out)
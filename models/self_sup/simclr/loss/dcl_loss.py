@@ -1,6 +1,8 @@
 import torch
 import numpy as np
 
+from models.self_sup.simclr.loss.chunked_loss import contrastive_logsumexp
+
 SMALL_NUM = np.log(1e-45)
 class DCL(object):
     """
@@ -12,6 +14,19 @@ class DCL(object):
     def __init__(self, args):
         super(DCL, self).__init__()
         self.temperature = args.temperature
+        self.chunk_size = args.contrastive_chunk_size
+        self.use_checkpoint = args.contrastive_checkpoint
+
+    def negative_loss(self, anchor, contrast):
+        """
+        Blockwise log-sum-exp of anchor @ contrast.T over contrast = [a; b] with the columns i
+        and i + len(a) of row i left out
+        """
+        return contrastive_logsumexp(
+            anchor, contrast, self.temperature, 
+            exclude_offsets=(0, contrast.size(0) // 2),
+            chunk_size=self.chunk_size,
+            use_checkpoint=self.use_checkpoint)
 
     def __call__(self, z1, z2):
         """
@@ -20,9 +35,37 @@ class DCL(object):
         :param z2: second embedding vector
         :return: one-way loss
         """
+        if self.chunk_size > 0:
+            positive_loss = -(z1 * z2).sum(dim=1) / self.temperature
+            return (positive_loss + self.negative_loss(z1, torch.cat((z1, z2)))).mean()
+
         cross_view_distance = torch.mm(z1, z2.t())
         positive_loss = -torch.diag(cross_view_distance) / self.temperature
         neg_similarity = torch.cat((torch.mm(z1, z1.t()), cross_view_distance), dim=1) / self.temperature
         neg_mask = torch.eye(z1.size(0), device=z1.device).repeat(1, 2)
         negative_loss = torch.logsumexp(neg_similarity + neg_mask * SMALL_NUM, dim=1, keepdim=False)
-        return (positive_loss + negative_loss).mean()
\ No newline at end of file
+        return (positive_loss + negative_loss).mean()
+
+    def symmetric(self, z1, z2):
+        """
+        Calculate the two way DCL loss, self(z1, z2) + self(z2, z1), from a single cross view
+        similarity matrix: the second direction reads it transposed.
+        :param z1: first embedding vector
+        :param z2: second embedding vector
+        :return: two-way loss
+        """
+        if self.chunk_size > 0:
+            # rows of z1 and z2 share one blockwise pass over [z1; z2]
+            z = torch.cat((z1, z2))
+            positive_loss = -(z1 * z2).sum(dim=1) / self.temperature
+            return (2 * positive_loss + self.negative_loss(z, z).view(2, -1).sum(dim=0)).mean()
+
+        neg_mask = torch.eye(z1.size(0), device=z1.device) * SMALL_NUM
+
+        cross_view_distance = torch.mm(z1, z2.t()) / self.temperature
+        positive_loss = -torch.diag(cross_view_distance)
+        cross_view_distance = cross_view_distance + neg_mask
+
+        negative_loss1 = torch.logsumexp(torch.cat((torch.mm(z1, z1.t()) / self.temperature + neg_mask, cross_view_distance), dim=1), dim=1)
+        negative_loss2 = torch.logsumexp(torch.cat((torch.mm(z2, z2.t()) / self.temperature + neg_mask, cross_view_distance.t()), dim=1), dim=1)
+        return (2 * positive_loss + negative_loss1 + negative_loss2).mean()
@@ -13,6 +13,8 @@ Adapted from
 import torch
 import torch.nn as nn
 
+from models.self_sup.simclr.loss.chunked_loss import contrastive_logsumexp
+
 class NTXentLoss(nn.Module):
     def __init__(self, args):
         super(NTXentLoss, self).__init__()
@@ -23,14 +25,19 @@ class NTXentLoss(nn.Module):
     def forward(self, features):
         """
         input:
-            - features: hidden feature representation of shape [b, 2, dim]
+            - features: hidden feature representation of shape [b, n, dim], n >= 2 views
         output:
-            - loss: loss computed according to SimCLR 
+            - loss: loss computed according to SimCLR, the first view of every image is the
+              anchor and its n - 1 other views are the positives
         """
 
         b, n, dim = features.size()
-        assert(n == 2)
-        mask = torch.eye(b, dtype=torch.float32).to(self.args.device)
+        assert(n >= 2)
+
+        if self.args.contrastive_chunk_size > 0:
+            return self.chunked_forward(features)
+
+        mask = torch.eye(b, dtype=torch.float32, device=features.device)
 
         contrast_features = torch.cat(torch.unbind(features, dim=1), dim=0)
         anchor = features[:, 0]
@@ -42,8 +49,8 @@ class NTXentLoss(nn.Module):
         logits_max, _ = torch.max(dot_product, dim=1, keepdim=True)
         logits = dot_product - logits_max.detach()
 
-        mask = mask.repeat(1, 2)
-        logits_mask = torch.scatter(torch.ones_like(mask), 1, torch.arange(b).view(-1, 1).cuda(), 0)
+        mask = mask.repeat(1, n)
+        logits_mask = torch.scatter(torch.ones_like(mask), 1, torch.arange(b, device=features.device).view(-1, 1), 0)
         mask = mask * logits_mask
 
         # Log-softmax
@@ -53,4 +60,22 @@ class NTXentLoss(nn.Module):
         # Mean log-likelihood for positive
         loss = - ((mask * log_prob).sum(1) / mask.sum(1)).mean()
 
-        return loss
\ No newline at end of file
+        return loss
+
+    def chunked_forward(self, features):
+        """
+        Same loss as forward, with the denominator computed blockwise so that neither the
+        [b, n * b] logits nor the masks are materialized.
+        """
+        contrast_features = torch.cat(torch.unbind(features, dim=1), dim=0)
+        anchor = features[:, 0]
+
+        # every column but the anchor itself
+        log_denominator = contrastive_logsumexp(
+            anchor, contrast_features, self.temperature, 
+            exclude_offsets=(0,),
+            chunk_size=self.args.contrastive_chunk_size,
+            use_checkpoint=self.args.contrastive_checkpoint)
+        positives = (anchor.unsqueeze(1) * features[:, 1:]).sum(dim=2).mean(dim=1) / self.temperature
+
+        return (log_denominator - positives).mean()
@@ -24,12 +24,21 @@ class SimCLR(nn.Module):
         )
 
     def forward(self, x):
-        b, c, h, w = x.size()
-        x = torch.cat([x.unsqueeze(1), x.unsqueeze(1)], dim=1)
+        """
+        x is the list of augmented views of a batch (or a [b, n, c, h, w] tensor of them). All
+        the views go through the backbone in one pass and the features come back as [b, n, dim].
+        A single [b, c, h, w] batch is used as both views of the pair.
+        """
+        if isinstance(x, (list, tuple)):
+            x = torch.stack(x, dim=1)
+        elif x.dim() == 4:
+            x = torch.stack([x, x], dim=1)
+
+        b, n, c, h, w = x.size()
         x = x.view(-1, c, h, w) 
 
-        x = x.cuda(non_blocking=True)
+        x = x.to(next(self.backbone.parameters()).device, non_blocking=True)
 
         features = self.contrastive_head(self.backbone(x))
         features = F.normalize(features, dim = 1)
-        return features.view(b, 2, -1)
+        return features.view(b, n, -1)
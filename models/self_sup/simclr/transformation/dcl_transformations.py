@@ -40,5 +40,6 @@ class TransformsDCL():
         if not is_train:
             return self.test_transform(x)
 
-        return self.train_transform(x)
+        # two independently augmented views of the image
+        return [self.train_transform(x), self.train_transform(x)]
         
\ No newline at end of file
@@ -14,10 +14,13 @@ class TransformsSimCLR():
     A stochastic data augmentation module that transforms any given data example randomly
     resulting in two correlated views of the same example,
     denoted x ̃i and x ̃j, which we consider as a positive pair.
+
+    `n_views` independent views are returned for every training image.
     """
     
-    def __init__(self, size):
+    def __init__(self, size, n_views=2):
         s = 1
+        self.n_views = n_views
 
         color_jitter = transforms.ColorJitter(
             0.8 * s, 0.8 * s, 0.8 * s, 0.2 * s
@@ -45,5 +48,4 @@ class TransformsSimCLR():
         if not is_train:
             return self.test_transform(x)
 
-        # return self.train_transform(x), self.train_transform(x)
-        return self.train_transform(x)
\ No newline at end of file
+        return [self.train_transform(x) for _ in range(self.n_views)]
\ No newline at end of file
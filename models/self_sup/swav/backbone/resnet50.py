@@ -320,8 +320,9 @@ class ResNet(nn.Module):
             return_counts=True,
         )[1], 0)
         start_idx = 0
+        device = next(self.parameters()).device
         for end_idx in idx_crops:
-            _out = self.forward_backbone(torch.cat(inputs[start_idx: end_idx]).cuda(non_blocking=True))
+            _out = self.forward_backbone(torch.cat(inputs[start_idx: end_idx]).to(device, non_blocking=True))
             if start_idx == 0:
                 output = _out
             else:
@@ -0,0 +1,58 @@
+'''
+Feature queue of SwAV as a ring buffer.
+
+The queue keeps the embeddings of the last `length` samples of every assignment crop. New
+embeddings overwrite the oldest ones at a moving write pointer instead of the whole queue being
+shifted, and a counter of the filled rows says when the queue is full, so no step has to look at
+the queue contents on the host. The order of the rows doesn't matter to the Sinkhorn-Knopp
+assignments, they only use the row and column sums of the scores.
+'''
+
+import torch
+
+
+class SwAVQueue():
+    def __init__(self, n_crops, length, dim, device) -> None:
+        self.embeddings = torch.zeros(n_crops, length, dim, device=device)
+        self.length = length
+        self.ptr = 0
+        self.filled = 0
+
+    @property
+    def full(self):
+        return self.filled >= self.length
+
+    @torch.no_grad()
+    def push(self, embeddings):
+        """Writes a (n_crops, batch size, dim) batch of embeddings over the oldest ones"""
+        # a batch longer than the queue only leaves its last rows in it
+        embeddings = embeddings[:, -self.length:]
+        bs = embeddings.size(1)
+
+        # the rows past the end of the buffer wrap around to its start, so batches of any size
+        # (e.g. the last, smaller batch of an epoch) can be pushed
+        rows = (self.ptr + torch.arange(bs, device=self.embeddings.device)) % self.length
+        self.embeddings.index_copy_(1, rows, embeddings.to(self.embeddings.dtype))
+
+        self.ptr = (self.ptr + bs) % self.length
+        self.filled = min(self.filled + bs, self.length)
+
+    def state_dict(self):
+        return {"queue": self.embeddings, "ptr": self.ptr, "filled": self.filled}
+
+    def load_state_dict(self, state):
+        queue = state["queue"].to(self.embeddings.device)
+        self.length = queue.size(1)
+
+        if "ptr" in state:
+            self.embeddings = queue
+            self.ptr = state["ptr"]
+            self.filled = state["filled"]
+            return
+
+        # queues saved before the ring buffer have the newest rows first and zeros at the end
+        filled = int(queue[0].any(dim=1).sum())
+        self.embeddings = torch.zeros_like(queue)
+        self.embeddings[:, :filled] = queue[:, :filled].flip(1)
+        self.ptr = filled % self.length
+        self.filled = filled
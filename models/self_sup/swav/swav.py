@@ -12,14 +12,17 @@ import torch.backends.cudnn as cudnn
 import torch.optim
 
 import os
-import time
 
 import numpy as np
+from models.self_sup.swav.queue import SwAVQueue
 from models.self_sup.swav.utils import initialize_exp
-from models.utils.commons import get_params, AverageMeter, get_params_to_update
+from models.utils.commons import get_params, get_params_to_update
+from models.trainers.engine import TrainingEngine
 from models.utils.training_type_enum import TrainingType
 from optim.optimizer import load_optimizer
+from utils.checkpoint_writer import flush_checkpoints, save_checkpoint
 from utils.commons import load_chkpts, load_saved_state
+from utils.precision import MixedPrecision
 import utils.logger as logging
 import models.self_sup.swav.backbone.resnet50 as resnet_models
 
@@ -68,12 +71,17 @@ class SwAVTrainer():
             train_params=self.train_params, 
             train_loader=self.train_loader
         )
+        self.precision = MixedPrecision(self.args)
+        self.engine = TrainingEngine(self.args, self.model, self.optimizer, self.precision, log_step=self.log_step,
+                                     verbose=self.args.rank == 0)
 
         # build the queue
         self.queue = None
         self.queue_path = os.path.join(args.model_misc_path, "queue" + str(args.rank) + ".pth")
         if os.path.isfile(self.queue_path):
-            self.queue = torch.load(self.queue_path)["queue"]
+            flush_checkpoints()
+            self.queue = self.build_queue()
+            self.queue.load_state_dict(torch.load(self.queue_path, map_location=self.args.device))
         # the queue needs to be divisible by the batch size
         self.args.queue_length -= args.queue_length % (args.swav_batch_size * args.world_size)
 
@@ -83,129 +91,121 @@ class SwAVTrainer():
 
         # optionally starts a queue
         if self.args.queue_length > 0 and epoch >= self.args.epoch_queue_starts and self.queue is None:
-            self.queue = torch.zeros(
-                len(self.args.crops_for_assign),
-                self.args.queue_length // self.args.world_size,
-                self.args.feat_dim,
-            ).cuda()
+            self.queue = self.build_queue()
 
         # train the network
         scores, self.queue = self.train(self.train_loader, epoch, self.queue)
-        self.training_stats.update(scores)
+        if self.args.rank == 0:
+            self.training_stats.update(scores)
 
         if self.queue is not None:
-            torch.save({"queue": self.queue}, self.queue_path)
-
+            save_checkpoint(self.args, self.queue.state_dict(), self.queue_path)
+
+    def build_queue(self):
+        return SwAVQueue(
+            len(self.args.crops_for_assign),
+            self.args.queue_length // self.args.world_size,
+            self.args.feat_dim,
+            self.args.device,
+        )
 
     def train(self, train_loader, epoch, queue):
-        batch_time = AverageMeter()
-        data_time = AverageMeter()
-        losses = AverageMeter()
-
-        self.model.train()
-        use_the_queue = False
-
-        end = time.time()
-        for it, inputs in enumerate(train_loader):
-            # measure data loading time
-            data_time.update(time.time() - end)
-
-            # update learning rate
-            iteration = epoch * len(train_loader) + it
-            for param_group in self.optimizer.param_groups:
-                param_group["lr"] = self.scheduler[iteration]
-
-            # normalize the prototypes
-            with torch.no_grad():
-                w = self.model.prototypes.weight.data.clone()
-                w = nn.functional.normalize(w, dim=1, p=2)
-                self.model.prototypes.weight.copy_(w)
-
-            # ============ multi-res forward passes ... ============
+        self.queue = queue
+        self.use_the_queue = False
+
+        loss = self.engine.train_epoch(
+            train_loader, epoch, self.compute_loss,
+            before_step=self.before_step,
+            after_backward=self.after_backward)
+
+        return (epoch, loss), self.queue
+
+    def before_step(self, epoch, it):
+        # update learning rate
+        self.scheduler.step(epoch, it)
+
+        # normalize the prototypes
+        with torch.no_grad():
+            w = self.model.prototypes.weight.data.clone()
+            w = nn.functional.normalize(w, dim=1, p=2)
+            self.model.prototypes.weight.copy_(w)
+
+    def compute_loss(self, inputs, epoch, it):
+        queue = self.queue
+
+        # ============ multi-res forward passes ... ============
+        with self.precision.autocast():
             embedding, output = self.model(inputs)
-            embedding = embedding.detach()
-            bs = inputs[0].size(0)
-
-            # ============ swav loss ... ============
-            loss = 0
-            for i, crop_id in enumerate(self.args.crops_for_assign):
-                with torch.no_grad():
-                    out = output[bs * crop_id: bs * (crop_id + 1)].detach()
-
-                    # time to use the queue
-                    if queue is not None:
-                        if use_the_queue or not torch.all(queue[i, -1, :] == 0):
-                            use_the_queue = True
-                            out = torch.cat((torch.mm(
-                                queue[i],
-                                self.model.prototypes.weight.t()
-                            ), out))
-                        # fill the queue
-                        queue[i, bs:] = queue[i, :-bs].clone()
-                        queue[i, :bs] = embedding[crop_id * bs: (crop_id + 1) * bs]
-
-                    # get assignments
-                    q = self.distributed_sinkhorn(out)[-bs:]
-
-                # cluster assignment prediction
-                subloss = 0
-                for v in np.delete(np.arange(np.sum(self.args.nmb_crops)), crop_id):
-                    x = output[bs * v: bs * (v + 1)] / self.args.temperature
-                    subloss -= torch.mean(torch.sum(q * F.log_softmax(x, dim=1), dim=1))
-                loss += subloss / (np.sum(self.args.nmb_crops) - 1)
-            loss /= len(self.args.crops_for_assign)
-
-            # ============ backward and optim step ... ============
-            self.optimizer.zero_grad()
-            loss.backward()
-            # cancel gradients for the prototypes
-            if iteration < self.args.freeze_prototypes_niters:
-                for name, p in self.model.named_parameters():
-                    if "prototypes" in name:
-                        p.grad = None
-            self.optimizer.step()
-
-            # ============ misc ... ============
-            losses.update(loss.item(), inputs[0].size(0))
-            batch_time.update(time.time() - end)
-            end = time.time()
-            if self.args.rank ==0 and it % self.log_step == 0:
-                logging.info(
-                    "Epoch: [{0}][{1}]\t"
-                    "Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t"
-                    "Data {data_time.val:.3f} ({data_time.avg:.3f})\t"
-                    "Loss {loss.val:.4f} ({loss.avg:.4f})\t"
-                    "Lr: {lr:.4f}".format(
-                        epoch,
-                        it,
-                        batch_time=batch_time,
-                        data_time=data_time,
-                        loss=losses,
-                        lr=self.optimizer.param_groups[0]["lr"],
-                    )
-                )
-        return (epoch, losses.avg), queue
+        output = output.float()
+        embedding = embedding.detach().float()
+        bs = inputs[0].size(0)
+
+        # ============ swav loss ... ============
+        with torch.no_grad():
+            # scores and embeddings of the assignment crops, (n assignment crops, bs, -1)
+            out = output.detach().view(-1, bs, output.size(1))[self.args.crops_for_assign]
+
+            # time to use the queue
+            if queue is not None:
+                if self.use_the_queue or queue.full:
+                    self.use_the_queue = True
+                    out = torch.cat((torch.matmul(
+                        queue.embeddings,
+                        self.model.prototypes.weight.t()
+                    ), out), dim=1)
+                # fill the queue
+                queue.push(embedding.view(-1, bs, embedding.size(1))[self.args.crops_for_assign])
+
+            # get assignments of all the assignment crops at once
+            assignments = self.distributed_sinkhorn(out)[:, -bs:]
+
+        # ============ swapped prediction ... ============
+        # log-probabilities of every crop, (n crops, bs, K)
+        n_crops = np.sum(self.args.nmb_crops)
+        log_p = F.log_softmax(output.view(n_crops, bs, -1) / self.args.temperature, dim=2)
+
+        # cross entropy of the codes of every assignment crop with the predictions of every
+        # crop, (n assignment crops, n crops), the crop an assignment comes from is left out
+        cross_entropy = -torch.einsum("abk,vbk->av", assignments, log_p) / bs
+        others = torch.ones_like(cross_entropy)
+        others[torch.arange(len(self.args.crops_for_assign)), self.args.crops_for_assign] = 0
+
+        loss = (cross_entropy * others).sum() / (n_crops - 1)
+        loss /= len(self.args.crops_for_assign)
+
+        return loss
+
+    def after_backward(self, epoch, it):
+        # cancel gradients for the prototypes
+        iteration = epoch * len(self.train_loader) + it
+        if iteration < self.args.freeze_prototypes_niters:
+            for name, p in self.model.named_parameters():
+                if "prototypes" in name:
+                    p.grad = None
 
 
     @torch.no_grad()
     def distributed_sinkhorn(self, out):
-        Q = torch.exp(out / self.args.epsilon).t() # Q is K-by-B for consistency with notations from our paper
-        B = Q.shape[1] * self.args.world_size # number of samples to assign
-        K = Q.shape[0] # how many prototypes
+        """
+        Assignments of the scores `out`, (B, K) or a (n, B, K) batch of them, each normalized
+        on its own. The normalizations are done in place on the one K-by-B buffer.
+        """
+        # always in float32, exp(out / epsilon) overflows in half precision
+        Q = (out.float() / self.args.epsilon).exp_().transpose(-2, -1) # Q is K-by-B for consistency with notations from our paper
+        B = Q.shape[-1] * self.args.world_size # number of samples to assign
+        K = Q.shape[-2] # how many prototypes
 
         # make the matrix sums to 1
-        sum_Q = torch.sum(Q)
-        Q /= sum_Q
+        Q /= torch.sum(Q, dim=(-2, -1), keepdim=True)
 
         for it in range(self.args.sinkhorn_iterations):
             # normalize each row: total weight per prototype must be 1/K
-            sum_of_rows = torch.sum(Q, dim=1, keepdim=True)
-            Q /= sum_of_rows
+            Q /= torch.sum(Q, dim=-1, keepdim=True)
             Q /= K
 
             # normalize each column: total weight per sample must be 1/B
-            Q /= torch.sum(Q, dim=0, keepdim=True)
+            Q /= torch.sum(Q, dim=-2, keepdim=True)
             Q /= B
 
         Q *= B # the colomns must sum to 1 so that Q is an assignment
-        return Q.t()
\ No newline at end of file
+        return Q.transpose(-2, -1)
@@ -12,12 +12,12 @@ from typing import List
 
 from PIL import ImageFilter, Image
 import numpy as np
-import torchvision.datasets as datasets
 import torchvision.transforms as transforms
 from utils.commons import pil_loader
+from datautils.dataset_index import CachedImageFolder
 
 
-class MultiCropDataset(datasets.ImageFolder):
+class MultiCropDataset(CachedImageFolder):
     def __init__(
         self,
         args,
@@ -29,7 +29,7 @@ class MultiCropDataset(datasets.ImageFolder):
         size_dataset=-1,
         return_index=False,
     ):
-        super(MultiCropDataset, self).__init__(data_path)
+        super(MultiCropDataset, self).__init__(args, data_path)
         assert len(size_crops) == len(nmb_crops)
         assert len(min_scale_crops) == len(nmb_crops)
         assert len(max_scale_crops) == len(nmb_crops)
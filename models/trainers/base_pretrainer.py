@@ -14,7 +14,7 @@ class BasePretrainer():
     
     def first_pretrain(self) :
         # initialize ResNet
-        encoder = resnet_backbone(self.args.backbone, pretrained=False)
+        encoder = resnet_backbone(self.args.backbone, pretrained=False, cached=True)
         print("=> creating model '{}'".format(self.args.backbone))
 
         if self.args.base_dataset == dataset_enum.DatasetType.IMAGENET.value:
@@ -2,18 +2,21 @@ import torch
 import torch.nn as nn
 from torch.optim.lr_scheduler import StepLR
 import time
-import copy
 import utils.logger as logging
 from datautils.dataset_enum import DatasetType, get_dataset_enum
 
 from datautils.finetune_dataset import LinearClassifier
 from models.backbones.resnet import resnet_backbone
 from models.heads.logloss_head import LogLossHead
+from models.trainers.engine import TrainingEngine
 from optim.optimizer import load_optimizer
 from models.utils.commons import accuracy, get_ds_num_classes, get_model_criterion, get_params, get_params_to_update, set_parameter_requires_grad
 from models.utils.training_type_enum import TrainingType
 from models.utils.early_stopping import EarlyStopping
-from utils.commons import load_chkpts, load_saved_state, save_accuracy_to_file, simple_save_model, simple_load_model
+from utils.precision import MixedPrecision
+from utils.device import cpu_autocast, prepare_model, to_device
+from utils.checkpointing import CheckpointManager
+from utils.commons import load_chkpts, load_saved_state, save_accuracy_to_file, simple_load_model
 
 
 class Classifier:
@@ -21,7 +24,7 @@ class Classifier:
 
         self.args = args
         
-        self.model = resnet_backbone(self.args.backbone, pretrained=False)
+        self.model = resnet_backbone(self.args.backbone, pretrained=False, cached=True)
 
         if pretrain_level == "AL":
             logging.info("Using pretext task weights")
@@ -41,14 +44,26 @@ class Classifier:
 
         set_parameter_requires_grad(self.model, feature_extract=True)
         self.model, self.criterion = get_model_criterion(self.args, self.model, TrainingType.LINEAR_CLASSIFIER, num_classes=num_classes)
-        self.model = self.model.to(self.args.device)
+        self.model = prepare_model(self.args, self.model)
 
         params_to_update = get_params_to_update(self.model, feature_extract=True)
 
         train_params = get_params(self.args, TrainingType.LINEAR_CLASSIFIER)
         self.optimizer, self.scheduler = load_optimizer(self.args, params_to_update, state, train_params)
-
-        self.best_model = copy.deepcopy(self.model)
+        self.precision = MixedPrecision(self.args)
+        self.engine = TrainingEngine(self.args, self.model, self.optimizer, self.precision)
+
+        # the best checkpoint is written when the validation accuracy improves
+        checkpointables = {'model': self.model, 'optimizer': self.optimizer}
+        if self.scheduler:
+            checkpointables['scheduler'] = self.scheduler
+        self.checkpoints = CheckpointManager(
+            self.args, self.args.model_checkpoint_path,
+            filename="classifier_checkpoint_{}.pth",
+            keep_recent=self.args.checkpoint_keep_recent,
+            save_every=self.args.checkpoint_freq,
+            best_filename="classifier_best.pth",
+            **checkpointables)
         self.best_acc = 0
 
     def train_and_eval(self, pretrain_data=None) -> None:
@@ -72,7 +87,7 @@ class Classifier:
             logging.info('-' * 10)
 
             # train for one epoch
-            train_loss, train_acc = self.train_single_epoch(train_loader)
+            train_loss, train_acc = self.train_single_epoch(train_loader, epoch)
 
             # evaluate on validation set
             val_loss, val_acc = self.validate(val_loader)
@@ -82,6 +97,8 @@ class Classifier:
             if self.scheduler:
                 self.scheduler.step()
 
+            self.checkpoints.step(epoch + 1, metric=val_acc, extra={'epoch': epoch + 1, 'best_acc': self.best_acc})
+
             # early stopping
             early_stopping(train_loss, val_loss)
             # if early_stopping.early_stop:
@@ -92,36 +109,32 @@ class Classifier:
         logging.info('Training complete in {:.0f}m {:.0f}s'.format(time_elapsed // 60, time_elapsed % 60))
         logging.info('Best val accuracy: {:3f}'.format(self.best_acc))
 
-        simple_save_model(self.args, self.best_model, 'classifier_{:4f}_acc.pth'.format(self.best_acc))
         save_accuracy_to_file(
             self.args, accuracies=val_acc_history, best_accuracy=self.best_acc, 
             filename=f"classifier_{get_dataset_enum(self.args.lc_dataset)}_batch_{self.args.lc_epochs}.txt")
 
         return self.model, val_acc_history
 
-    def train_single_epoch(self, train_loader):
-        self.model.train()
+    def train_single_epoch(self, train_loader, epoch=0):
+        # running sums stay on the device, they are read once at the end of the epoch
+        stats = {"loss": 0.0, "corrects": 0}
 
-        total_loss, corrects = 0.0, 0
-        for step, (images, targets) in enumerate(train_loader):
-            images, targets = images.to(self.args.device), targets.to(self.args.device)
+        def compute_loss(batch, epoch, step):
+            images, targets = batch
 
-            self.optimizer.zero_grad()
-            outputs = self.model(images)
+            with self.precision.autocast():
+                outputs = self.model(images).float()
             loss = self.criterion(outputs, targets)
             _, preds = torch.max(outputs, 1)
 
-            loss.backward()
-            self.optimizer.step()
-
-            if step % self.args.log_step == 0:
-                logging.info(f"Train Step [{step}/{len(train_loader)}]\t Loss: {loss.item()}")
-
             # statistics
-            total_loss += loss.item() * images.size(0)
-            corrects += torch.sum(preds == targets.data)
+            stats["loss"] += loss.detach() * images.size(0)
+            stats["corrects"] += torch.sum(preds == targets.data)
+            return loss
+
+        self.engine.train_epoch(train_loader, epoch, compute_loss)
 
-        epoch_loss, epoch_acc = accuracy(total_loss, corrects, train_loader)
+        epoch_loss, epoch_acc = accuracy(float(stats["loss"]), stats["corrects"], train_loader)
         epoch_acc = epoch_acc * 100.0
         logging.info('Train Loss: {:.4f} Acc: {:.4f}'.format(epoch_loss, epoch_acc))
 
@@ -131,14 +144,16 @@ class Classifier:
     def validate(self, val_loader):    
         self.model.eval()
 
+        # running sums stay on the device, they are read once at the end of the epoch
         total_loss, corrects = 0.0, 0
         with torch.no_grad():
             for step, (images, targets) in enumerate(val_loader):
-                images = images.to(self.args.device)
+                images = to_device(self.args, images)
                 targets = targets.to(self.args.device)
 
                 # compute output
-                outputs = self.model(images)
+                with cpu_autocast(self.args):
+                    outputs = self.model(images).float()
                 loss = self.criterion(outputs, targets)
                 _, preds = torch.max(outputs, 1)
 
@@ -146,16 +161,14 @@ class Classifier:
                     logging.info(f"Eval Step [{step}/{len(val_loader)}]\t Loss: {loss.item()}")
 
                 # statistics
-                total_loss += loss.item() * images.size(0)
+                total_loss += loss * images.size(0)
                 corrects += torch.sum(preds == targets.data)
 
-            epoch_loss, epoch_acc = accuracy(total_loss, corrects, val_loader)
+            epoch_loss, epoch_acc = accuracy(float(total_loss), corrects, val_loader)
             epoch_acc = epoch_acc * 100.0
 
-            # deep copy the model
             if epoch_acc > self.best_acc:
                 self.best_acc = epoch_acc
-                self.best_model = copy.deepcopy(self.model)
 
             logging.info('Val Loss: {:.4f} Acc@1: {:.3f} Best Acc@1 so far: {:.3f}'.format(epoch_loss, epoch_acc, self.best_acc))
 
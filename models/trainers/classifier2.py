@@ -16,9 +16,13 @@ import torch.optim
 from datautils.finetune_dataset import LinearClassifier
 from models.self_sup.swav.utils import accuracy, initialize_exp
 from models.utils.commons import AverageMeter, get_ds_num_classes, get_params
+from models.trainers.engine import TrainingEngine
 from models.utils.training_type_enum import TrainingType
 from optim.optimizer import load_optimizer
+from utils.checkpointing import CheckpointManager
 from utils.commons import load_chkpts, load_classifier_chkpts
+from utils.precision import MixedPrecision
+from utils.device import cpu_autocast, prepare_model, to_device
 import utils.logger as logging
 import models.self_sup.swav.backbone.resnet50 as resnet_models
 
@@ -37,8 +41,8 @@ class Classifier2():
         model = resnet_models.__dict__[args.backbone](output_dim=0, eval_mode=True)
         linear_classifier = LogReg(num_classes, args.backbone, args.global_pooling, args.use_bn)
 
-        # model to gpu
-        self.model = model.to(self.args.device)
+        # model to the device
+        self.model = prepare_model(self.args, model)
         self.linear_classifier = linear_classifier.to(self.args.device)
 
         self.model.eval()
@@ -51,6 +55,16 @@ class Classifier2():
 
         train_params = get_params(self.args, TrainingType.LINEAR_CLASSIFIER)
         self.optimizer, self.scheduler = load_optimizer(self.args, self.linear_classifier.parameters(), train_params=train_params)
+        self.precision = MixedPrecision(self.args)
+        self.checkpoints = CheckpointManager(
+            self.args, self.args.model_checkpoint_path,
+            filename="classifier_checkpoint_{}.pth",
+            keep_recent=self.args.checkpoint_keep_recent,
+            best_filename="classifier_best.pth",
+            state_dict=self.linear_classifier,
+            optimizer=self.optimizer,
+            scheduler=self.scheduler,
+        )
         
         cudnn.benchmark = True
 
@@ -67,15 +81,8 @@ class Classifier2():
 
             self.scheduler.step()
 
-            # save checkpoint
-            save_dict = {
-                "epoch": epoch + 1,
-                "state_dict": self.linear_classifier.state_dict(),
-                "optimizer": self.optimizer.state_dict(),
-                "scheduler": self.scheduler.state_dict(),
-                "best_acc": self.best_acc,
-            }
-            torch.save(save_dict, os.path.join(self.args.model_checkpoint_path, 'classifier_{:4f}_acc.pth'.format(self.best_acc)))
+            # save checkpoint, the best one is kept as classifier_best.pth
+            self.checkpoints.step(epoch + 1, metric=scores_val[1], extra={"epoch": epoch + 1, "best_acc": self.best_acc})
 
             logging.info("Training of the supervised linear classifier on frozen features completed.\n"
                     "Top-1 test accuracy: {acc:.1f}\n".format(acc=self.best_acc))
@@ -84,73 +91,35 @@ class Classifier2():
         """
         Train the models on the dataset.
         """
-        # running statistics
-        batch_time = AverageMeter()
-        data_time = AverageMeter()
-
         # training statistics
         top1 = AverageMeter()
         top5 = AverageMeter()
-        losses = AverageMeter()
-        end = time.perf_counter()
 
         model.eval()
-        reglog.train()
-        criterion = nn.CrossEntropyLoss().cuda()
+        criterion = nn.CrossEntropyLoss().to(self.args.device)
 
-        for step, (inp, target) in enumerate(loader):
-            # measure data loading time
-            data_time.update(time.perf_counter() - end)
-
-            # move to gpu
-            inp = inp.cuda(non_blocking=True)
-            target = target.cuda(non_blocking=True)
+        def compute_loss(batch, epoch, step):
+            inp, target = batch
 
             # forward
-            with torch.no_grad():
-                output = model(inp)
-            output = reglog(output)
+            with self.precision.autocast():
+                with torch.no_grad():
+                    output = model(inp)
+                output = reglog(output).float()
 
             # compute cross entropy loss
             loss = criterion(output, target)
 
-            # compute the gradients
-            optimizer.zero_grad()
-            loss.backward()
-
-            # step
-            optimizer.step()
-
             # update stats
             acc1, acc5 = accuracy(output, target, topk=(1, 5))
-            losses.update(loss.item(), inp.size(0))
             top1.update(acc1[0], inp.size(0))
             top5.update(acc5[0], inp.size(0))
+            return loss
 
-            batch_time.update(time.perf_counter() - end)
-            end = time.perf_counter()
+        engine = TrainingEngine(self.args, reglog, optimizer, self.precision)
+        loss = engine.train_epoch(loader, epoch, compute_loss, meters={"Prec": top1})
 
-            # verbose
-            if step % self.args.log_step == 0:
-                logging.info(
-                    "Epoch[{0}] - Iter: [{1}/{2}]\t"
-                    "Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t"
-                    "Data {data_time.val:.3f} ({data_time.avg:.3f})\t"
-                    "Loss {loss.val:.4f} ({loss.avg:.4f})\t"
-                    "Prec {top1.val:.3f} ({top1.avg:.3f})\t"
-                    "LR {lr}".format(
-                        epoch,
-                        step,
-                        len(loader),
-                        batch_time=batch_time,
-                        data_time=data_time,
-                        loss=losses,
-                        top1=top1,
-                        lr=optimizer.param_groups[0]["lr"],
-                    )
-                )
-
-        return epoch, losses.avg, top1.avg.item(), top5.avg.item()
+        return epoch, loss, top1.avg, top5.avg
 
 
     def validate_network(self, val_loader, model, linear_classifier):
@@ -163,22 +132,23 @@ class Classifier2():
         model.eval()
         linear_classifier.eval()
 
-        criterion = nn.CrossEntropyLoss().cuda()
+        criterion = nn.CrossEntropyLoss().to(self.args.device)
 
         with torch.no_grad():
             end = time.perf_counter()
             for step, (inp, target) in enumerate(val_loader):
 
-                # move to gpu
-                inp = inp.cuda(non_blocking=True)
-                target = target.cuda(non_blocking=True)
+                # move to the device
+                inp = to_device(self.args, inp)
+                target = target.to(self.args.device, non_blocking=True)
 
                 # compute output
-                output = linear_classifier(model(inp))
+                with cpu_autocast(self.args):
+                    output = linear_classifier(model(inp)).float()
                 loss = criterion(output, target)
 
                 acc1, acc5 = accuracy(output, target, topk=(1, 5))
-                losses.update(loss.item(), inp.size(0))
+                losses.update(loss, inp.size(0))
                 top1.update(acc1[0], inp.size(0))
                 top5.update(acc5[0], inp.size(0))
 
@@ -186,8 +156,9 @@ class Classifier2():
                 batch_time.update(time.perf_counter() - end)
                 end = time.perf_counter()
 
-        if top1.avg.item() > self.best_acc:
-            self.best_acc = top1.avg.item()
+        acc = top1.avg
+        if acc > self.best_acc:
+            self.best_acc = acc
 
         logging.info(
             "Test:\t"
@@ -198,7 +169,7 @@ class Classifier2():
                 batch_time=batch_time, loss=losses, top1=top1, acc=self.best_acc))
             
 
-        return losses.avg, top1.avg.item(), top5.avg.item()
+        return losses.avg, top1.avg, top5.avg
 
 
 class LogReg(nn.Module):
@@ -0,0 +1,111 @@
+'''
+Training loop shared by the trainers.
+
+The engine owns the step loop: it prefetches the batches to the device (see
+datautils/prefetcher.py), clears the gradients, runs the backward pass and the optimizer step
+through the mixed precision policy, keeps the loss and timing meters and writes the log lines.
+The trainers only provide the method specific parts as hooks:
+
+    compute_loss(batch, epoch, step)    forward passes and loss of the method, on a batch that is
+                                        already on the device. Forward passes go in
+                                        engine.precision.autocast(), the loss is returned in float32
+    before_step(epoch, step)            before the forward, e.g. learning rate schedules
+    after_backward(epoch, step)         between the backward and the optimizer step, e.g. dropping
+                                        the gradients of frozen parameters
+    after_step(epoch, step, loss)       after the optimizer step, e.g. moving average updates
+
+The hooks get the step in the epoch. The log lines use the step counted from `step_offset`, so a
+trainer with a global step counter logs with it, and only the processes with `verbose` on log.
+'''
+
+import time
+
+import torch
+
+from datautils.prefetcher import Prefetcher
+from models.utils.commons import AverageMeter
+from utils.precision import MixedPrecision
+import utils.logger as logging
+
+
+def get_batch_size(batch):
+    """Size of the first dimension of the first tensor of a (nested) batch"""
+    if torch.is_tensor(batch):
+        return batch.size(0)
+
+    items = batch.values() if isinstance(batch, dict) else batch
+    for item in items:
+        if torch.is_tensor(item) or isinstance(item, (list, tuple, dict)):
+            return get_batch_size(item)
+
+    return 1
+
+
+class TrainingEngine():
+    def __init__(self, args, model, optimizer, precision=None, log_step=None, verbose=True) -> None:
+        self.args = args
+        self.model = model
+        self.optimizer = optimizer
+        self.precision = precision if precision is not None else MixedPrecision(args)
+        self.log_step = log_step if log_step else args.log_step
+        self.verbose = verbose
+
+    def train_epoch(self, loader, epoch, compute_loss, before_step=None, after_backward=None, after_step=None, meters=None, step_offset=0) -> float:
+        """
+        Runs one epoch over `loader` and returns the average loss. `meters` are extra named
+        AverageMeters, updated by the hooks, that are added to the log lines, and `step_offset` is
+        the global step of the first batch, for the log lines. The meters keep their sums on the
+        device, so the host only waits for the device on the log steps.
+        """
+        batch_time = AverageMeter()
+        data_time = AverageMeter()
+        losses = AverageMeter()
+        meters = meters or {}
+
+        self.model.train()
+
+        end = time.time()
+        for step, batch in enumerate(Prefetcher(self.args, loader)):
+            data_time.update(time.time() - end)
+
+            if before_step is not None:
+                before_step(epoch, step)
+
+            self.optimizer.zero_grad()
+            loss = compute_loss(batch, epoch, step)
+            self.precision.backward(loss)
+
+            if after_backward is not None:
+                after_backward(epoch, step)
+
+            self.precision.step(self.optimizer)
+
+            if after_step is not None:
+                after_step(epoch, step, loss)
+
+            losses.update(loss.detach(), get_batch_size(batch))
+            batch_time.update(time.time() - end)
+            end = time.time()
+
+            if self.verbose and (step_offset + step) % self.log_step == 0:
+                self.log(epoch, step_offset + step, batch_time, data_time, losses, meters)
+
+        return losses.avg
+
+    def log(self, epoch, step, batch_time, data_time, losses, meters):
+        extra = "".join("\t{} {:.3f} ({:.3f})".format(name, meter.val, meter.avg) for name, meter in meters.items())
+        logging.info(
+            "Epoch: [{0}][{1}]\t"
+            "Time {batch_time.val:.3f} ({batch_time.avg:.3f})\t"
+            "Data {data_time.val:.3f} ({data_time.avg:.3f})\t"
+            "Loss {loss.val:.4f} ({loss.avg:.4f})\t"
+            "Lr: {lr:.4f}{extra}".format(
+                epoch,
+                step,
+                batch_time=batch_time,
+                data_time=data_time,
+                loss=losses,
+                lr=self.optimizer.param_groups[0]["lr"],
+                extra=extra,
+            )
+        )
@@ -10,7 +10,7 @@ from models.self_sup.myow.trainer.myow_trainer import get_myow_trainer
 from models.self_sup.simclr.trainer.simclr_trainer import SimCLRTrainer
 from models.self_sup.simclr.trainer.simclr_trainer_v2 import SimCLRTrainerV2
 from models.utils.training_type_enum import TrainingType
-from utils.commons import load_path_loss, save_state
+from utils.commons import get_checkpoint_manager, load_path_loss, save_state
 from models.utils.ssl_method_enum import SSL_Method
 
 
@@ -69,6 +69,7 @@ class SelfSupPretrainer(BasePretrainer):
 
         model = trainer.model
         optimizer = trainer.optimizer
+        checkpoints = get_checkpoint_manager(self.args, model, optimizer, pretrain_level, train_params.optimizer)
 
         for epoch in range(epochs):
             logging.info('\nEpoch {}/{}'.format(epoch, epochs))
@@ -82,12 +83,10 @@ class SelfSupPretrainer(BasePretrainer):
                 trainer.scheduler.step()
                 lr = trainer.scheduler.get_last_lr()
 
-            if epoch > 1 and epoch % epochs//2 == 0:
-                save_state(self.args, model, optimizer, pretrain_level, train_params.optimizer)
-
             self.args.current_epoch += 1
+            save_state(self.args, checkpoints)
 
-        save_state(self.args, model, optimizer, pretrain_level, train_params.optimizer)
+        save_state(self.args, checkpoints, final=True)
 
 
     def first_pretrain(self) -> None:
@@ -107,7 +106,7 @@ class SelfSupPretrainer(BasePretrainer):
         else:
             loader = get_target_pretrain_ds(self.args, training_type=TrainingType.TARGET_PRETRAIN).get_loader()        
 
-        encoder = resnet_backbone(self.args.backbone, pretrained=False)
+        encoder = resnet_backbone(self.args.backbone, pretrained=False, cached=True)
 
 
         self.base_pretrain(encoder, loader, self.args.target_epochs, trainingType=TrainingType.TARGET_PRETRAIN)
\ No newline at end of file
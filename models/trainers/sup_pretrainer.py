@@ -4,43 +4,29 @@ from models.utils.commons import get_model_criterion, get_params
 from optim.optimizer import load_optimizer
 import utils.logger as logging
 from models.utils.training_type_enum import TrainingType
-from utils.commons import save_state
+from utils.commons import get_checkpoint_manager, save_state
+from utils.precision import MixedPrecision
+from models.trainers.engine import TrainingEngine
 
 class SupPretrainer(BasePretrainer):
     def __init__(self, args, writer) -> None:
         self.args = args
         self.writer = writer
+        self.precision = MixedPrecision(self.args)
 
-    def train_epoch(self, model, train_loader, criterion, optimizer, train_params) -> int:
-        total_loss, total_num = 0, 0
-        model.train()
+    def train_epoch(self, engine, train_loader, criterion, epoch) -> int:
+        def compute_loss(batch, epoch, step):
+            image, target = batch
 
-        for step, (image, target) in enumerate(train_loader):
-            # Clear gradients w.r.t. parameters
-            optimizer.zero_grad()
-
-            image = image.to(self.args.device)
-            target = target.to(self.args.device)
-
-            output = model(image)
-            loss = criterion(output, target)
-
-            # Getting gradients w.r.t. parameters
-            loss.backward()
-
-            # Updating parameters
-            optimizer.step()
-
-            total_num += train_params.batch_size
-            total_loss += loss.item() * train_params.batch_size
-
-            if step % self.args.log_step == 0:
-                logging.info(f"Step [{step}/{len(train_loader)}]\t Loss: {total_loss / total_num}")
+            with self.precision.autocast():
+                output = engine.model(image)
+            return criterion(output.float(), target)
 
+        def after_step(epoch, step, loss):
             self.writer.add_scalar("Loss/train_epoch", loss, self.args.global_step)
             self.args.global_step += 1
 
-        return total_loss / total_num
+        return engine.train_epoch(train_loader, epoch, compute_loss, after_step=after_step)
 
     def base_pretrain(self, model, train_loader, epochs, trainingType, optimizer_type) -> None:
         pretrain_level = "1" if trainingType == TrainingType.BASE_PRETRAIN else "2"        
@@ -51,12 +37,14 @@ class SupPretrainer(BasePretrainer):
 
         train_params = get_params(self.args, trainingType)
         optimizer, scheduler = load_optimizer(self.args, model.parameters(), None, train_params)
+        engine = TrainingEngine(self.args, model, optimizer, self.precision)
+        checkpoints = get_checkpoint_manager(self.args, model, optimizer, pretrain_level, optimizer_type)
 
         for epoch in range(self.args.start_epoch, epochs):
             logging.info('\nEpoch {}/{}'.format(epoch, (epochs - self.args.start_epoch)))
             logging.info('-' * 20)
 
-            epoch_loss = self.train_epoch(model, train_loader, criterion, optimizer, train_params)
+            epoch_loss = self.train_epoch(engine, train_loader, criterion, epoch)
 
             lr = 0
             # Decay Learning Rate
@@ -64,15 +52,13 @@ class SupPretrainer(BasePretrainer):
                 scheduler.step()
                 lr = scheduler.get_last_lr()
 
-            if epoch > 0 and epoch % 20 == 0:
-                save_state(self.args, model, optimizer, pretrain_level, optimizer_type)
-
             logging.info(f"Epoch Loss: {epoch_loss}\t lr: {lr}")
             logging.info('-' * 20)
 
             self.args.current_epoch += 1
+            save_state(self.args, checkpoints)
 
-        save_state(self.args, model, optimizer, pretrain_level, optimizer_type)
+        save_state(self.args, checkpoints, final=True)
 
 
     def first_pretrain(self) -> None:
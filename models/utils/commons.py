@@ -4,6 +4,7 @@ import torchvision
 from torch.utils.data import random_split
 import gc
 from datautils.dataset_enum import DatasetType
+from datautils.dataset_index import CachedImageFolder
 
 from models.self_sup.simclr.loss.dcl_loss import DCL
 from models.self_sup.simclr.loss.nt_xent_loss import NTXentLoss
@@ -65,15 +66,15 @@ def set_parameter_requires_grad(model, feature_extract):
         for param in model.parameters():
             param.requires_grad = False
 
-def get_params_to_update(model, feature_extract):
-    params_to_update = model.parameters()
+def get_params_to_update(model, feature_extract, named=False):
+    params_to_update = model.named_parameters() if named else model.parameters()
 
     if feature_extract:
         params_to_update = []
 
         for name, param in model.named_parameters():
             if param.requires_grad == True:
-                params_to_update.append(param)
+                params_to_update.append((name, param) if named else param)
 
     return params_to_update
 
@@ -157,8 +158,8 @@ def accuracy(loss, corrects, loader):
     return epoch_loss, epoch_acc
 
 def split_dataset(args, dir, transforms, ratio=0.6, is_classifier=False):
-    dataset = torchvision.datasets.ImageFolder(
-        dir,
+    dataset = CachedImageFolder(
+        args, dir,
         transform=transforms)
 
     return split_dataset2(dataset, ratio, is_classifier)
@@ -218,24 +219,43 @@ def get_ds_num_classes(dataset):
     
     return num_classes, dir
 
+def _to_number(x):
+    return x.item() if torch.is_tensor(x) else x
+
 class AverageMeter(object):
-    """computes and stores the average and current value"""
+    """
+    computes and stores the average and current value. Tensor values are summed on their device,
+    the host sync only happens when val, sum or avg is read (e.g. when a log line is written)
+    """
 
     def __init__(self):
         self.reset()
 
     def reset(self):
-        self.val = 0
-        self.avg = 0
-        self.sum = 0
+        self._val = 0
+        self._sum = 0
         self.count = 0
 
     def update(self, val, n=1):
-        self.val = val
-        self.sum += val * n
+        if torch.is_tensor(val):
+            val = val.detach()
+
+        self._val = val
+        self._sum = self._sum + val * n
         self.count += n
-        self.avg = self.sum / self.count
-        
+
+    @property
+    def val(self):
+        return _to_number(self._val)
+
+    @property
+    def sum(self):
+        return _to_number(self._sum)
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else 0
+
 def free_mem(X, y):
     del X
     del y
@@ -5,9 +5,11 @@
 # LICENSE file in the root directory of this source tree.
 #
 
+import json
 import os
 import logging
 import time
+import weakref
 from datetime import timedelta
 import pandas as pd
 
@@ -68,28 +70,65 @@ def create_logger(filepath, rank):
     return logger
 
 
+def _write_rows(path, buffer):
+    if not buffer:
+        return
+
+    with open(path, "a") as f:
+        f.write("\n".join(buffer) + "\n")
+    buffer.clear()
+
+
 class PD_Stats(object):
     """
-    Log stuff with pandas library
+    Log stuff with pandas library. The rows are appended to a json lines file, so an update
+    costs the same whatever the length of the history. Rows logged with save=False are kept in a
+    buffer and written with the next saved row, or when the stats are closed, dropped or the
+    process exits. The DataFrame is only built when `stats` is read.
     """
 
     def __init__(self, path, columns):
         self.path = path
+        self.columns = list(columns)
+        self.buffer = []
+
+        # stats of a run logged before the json lines files are carried over
+        legacy_path = os.path.splitext(self.path)[0] + ".pkl"
+        if not os.path.isfile(self.path) and legacy_path != self.path and os.path.isfile(legacy_path):
+            for row in pd.read_pickle(legacy_path).itertuples(index=False):
+                self.update(list(row), save=False)
+            self.flush()
 
         # reload path stats
         if os.path.isfile(self.path):
-            self.stats = pd.read_pickle(self.path)
+            with open(self.path) as f:
+                first = f.readline()
 
             # check that columns are the same
-            # print(list(self.stats.columns), list(columns))
-            assert list(self.stats.columns) == list(columns)
+            if first:
+                assert list(json.loads(first)) == self.columns
 
-        else:
-            self.stats = pd.DataFrame(columns=columns)
+        # doesn't keep the stats alive, it runs once when they are closed, collected or at exit
+        self._finalizer = weakref.finalize(self, _write_rows, self.path, self.buffer)
 
     def update(self, row, save=True):
-        self.stats.loc[len(self.stats.index)] = row
+        self.buffer.append(json.dumps(dict(zip(self.columns, row)), default=float))
 
         # save the statistics
         if save:
-            self.stats.to_pickle(self.path)
\ No newline at end of file
+            self.flush()
+
+    def flush(self):
+        _write_rows(self.path, self.buffer)
+
+    def close(self):
+        """Writes the buffered rows, rows buffered after that are no longer written at exit"""
+        self._finalizer()
+
+    @property
+    def stats(self):
+        self.flush()
+        if not os.path.isfile(self.path) or os.path.getsize(self.path) == 0:
+            return pd.DataFrame(columns=self.columns)
+
+        return pd.read_json(self.path, lines=True)[self.columns]
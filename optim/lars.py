@@ -33,6 +33,9 @@ class LARS(Optimizer):
     ):
         """Constructs a LARSOptimizer.
         Args:
+        params: the parameters, or (name, parameter) pairs such as model.named_parameters().
+            The exclusion lists below are matched against the names, so they only apply when
+            the names are given.
         lr: A `float` for learning rate.
         momentum: A `float` for momentum.
         use_nesterov: A 'Boolean' for whether to use nesterov momentum.
@@ -53,6 +56,13 @@ class LARS(Optimizer):
         """
 
         self.epoch = 0
+
+        params = list(params)
+        self.param_names = {}
+        if params and isinstance(params[0], tuple):
+            self.param_names = {p: name for name, p in params}
+            params = [p for _, p in params]
+
         defaults = dict(
             lr=lr,
             momentum=momentum,
@@ -79,6 +89,9 @@ class LARS(Optimizer):
         else:
             self.exclude_from_layer_adaptation = exclude_from_weight_decay
 
+        # per group indices of the decayed and the adapted parameters, see _group_indices
+        self._indices = {}
+
     def step(self, epoch=None, closure=None):
         loss = None
         if closure is not None:
@@ -88,69 +101,97 @@ class LARS(Optimizer):
             epoch = self.epoch
             self.epoch += 1
 
-        for group in self.param_groups:
-            weight_decay = group["weight_decay"]
-            momentum = group["momentum"]
-            eeta = group["eeta"]
-            lr = group["lr"]
+        for index, group in enumerate(self.param_groups):
+            if not group["classic_momentum"]:
+                raise NotImplementedError
 
+            params, grads, buffers, names, model_params = [], [], [], [], []
             for p in group["params"]:
                 if p.grad is None:
                     continue
 
-                param = p.data
-                grad = p.grad.data
-
                 param_state = self.state[p]
 
-                # TODO: get param names
-                # if self._use_weight_decay(param_name):
-                grad += self.weight_decay * param
-
-                if self.classic_momentum:
-                    trust_ratio = 1.0
-
-                    # TODO: get param names
-                    # if self._do_layer_adaptation(param_name):
-                    w_norm = torch.norm(param)
-                    g_norm = torch.norm(grad)
-
-                    device = g_norm.get_device()
-                    trust_ratio = torch.where(
-                        w_norm.ge(0),
-                        torch.where(
-                            g_norm.ge(0),
-                            (self.eeta * w_norm / g_norm),
-                            torch.Tensor([1.0]).to(device),
-                        ),
-                        torch.Tensor([1.0]).to(device),
-                    ).item()
-
-                    scaled_lr = lr * trust_ratio
-                    if "momentum_buffer" not in param_state:
-                        next_v = param_state["momentum_buffer"] = torch.zeros_like(
-                            p.data
-                        )
-                    else:
-                        next_v = param_state["momentum_buffer"]
-
-                    next_v.mul_(momentum).add_(scaled_lr, grad)
-                    if self.use_nesterov:
-                        update = (self.momentum * next_v) + (scaled_lr * grad)
-                    else:
-                        update = next_v
-
-                    p.data.add_(-update)
+                # half precision parameters are updated through a float32 master copy
+                if p.dtype in [torch.float16, torch.bfloat16]:
+                    if "master_param" not in param_state:
+                        param_state["master_param"] = p.data.float()
+                    params.append(param_state["master_param"])
+                    grads.append(p.grad.data.float())
                 else:
-                    raise NotImplementedError
+                    params.append(p.data)
+                    grads.append(p.grad.data)
+
+                if "momentum_buffer" not in param_state:
+                    param_state["momentum_buffer"] = torch.zeros_like(params[-1])
+                buffers.append(param_state["momentum_buffer"])
+                names.append(self.param_names.get(p))
+                model_params.append(p)
+
+            if not params:
+                continue
+
+            decay, adapt = self._group_indices(index, group, names, model_params, params[0].device)
+            self._step_group(group, params, grads, buffers, decay, adapt)
+
+            for p, param in zip(model_params, params):
+                if param is not p.data:
+                    p.data.copy_(param)
 
         return loss
 
-    def _use_weight_decay(self, param_name):
+    def _group_indices(self, index, group, names, model_params, device):
+        """
+        Positions, among the parameters of a group that have a gradient, of the ones with weight
+        decay and (as a tensor on the device) of the ones with layer adaptation. The names are only
+        matched again when the parameters with a gradient change, e.g. when some are frozen.
+        """
+        key = (tuple(id(p) for p in model_params), bool(group["weight_decay"]), device)
+        cached = self._indices.get(index)
+        if cached is None or cached[0] != key:
+            decay = [i for i, name in enumerate(names) if self._use_weight_decay(name, group["weight_decay"])]
+            adapt = [i for i, name in enumerate(names) if self._do_layer_adaptation(name)]
+            cached = self._indices[index] = (key, decay, torch.tensor(adapt, dtype=torch.long, device=device))
+
+        return cached[1], cached[2]
+
+    def _step_group(self, group, params, grads, buffers, decay, adapt):
+        """One update of the parameters of a group, with every per parameter value kept on the device"""
+        momentum = group["momentum"]
+        lr = group["lr"]
+
+        if decay:
+            torch._foreach_add_([grads[i] for i in decay], [params[i] for i in decay], alpha=group["weight_decay"])
+
+        # trust ratios of all the adapted parameters at once, they never leave the device
+        device = params[0].device
+        scaled_lr = torch.full((len(params),), lr, dtype=torch.float32, device=device)
+        if adapt.numel():
+            w_norm = torch.stack(torch._foreach_norm(params)).float()[adapt]
+            g_norm = torch.stack(torch._foreach_norm(grads)).float()[adapt]
+            trust_ratio = torch.where(
+                (w_norm > 0) & (g_norm > 0),
+                group["eeta"] * w_norm / g_norm,
+                torch.ones_like(w_norm),
+            )
+            scaled_lr.index_copy_(0, adapt, lr * trust_ratio)
+
+        scaled_grads = torch._foreach_mul(grads, list(scaled_lr.unbind()))
+
+        torch._foreach_mul_(buffers, momentum)
+        torch._foreach_add_(buffers, scaled_grads)
+        if group["use_nesterov"]:
+            update = torch._foreach_add(torch._foreach_mul(buffers, momentum), scaled_grads)
+        else:
+            update = buffers
+
+        torch._foreach_sub_(params, update)
+
+    def _use_weight_decay(self, param_name, weight_decay):
         """Whether to use L2 weight decay for `param_name`."""
-        if not self.weight_decay:
+        if not weight_decay:
             return False
-        if self.exclude_from_weight_decay:
+        if self.exclude_from_weight_decay and param_name is not None:
             for r in self.exclude_from_weight_decay:
                 if re.search(r, param_name) is not None:
                     return False
@@ -158,7 +199,7 @@ class LARS(Optimizer):
 
     def _do_layer_adaptation(self, param_name):
         """Whether to do layer-wise learning rate adaptation for `param_name`."""
-        if self.exclude_from_layer_adaptation:
+        if self.exclude_from_layer_adaptation and param_name is not None:
             for r in self.exclude_from_layer_adaptation:
                 if re.search(r, param_name) is not None:
                     return False
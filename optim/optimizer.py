@@ -1,5 +1,4 @@
 import math
-import numpy as np
 import torch
 from torch.optim.lr_scheduler import CosineAnnealingLR
 from torch.optim import SGD, Adam
@@ -8,9 +7,21 @@ from models.utils.training_type_enum import Params
 from .lars import LARS
 import utils.logger as logging
 
+# names of the batch norm parameters (bn1, the shortcut/downsample norms) and of the biases
+LARS_EXCLUDE = ["batch_normalization", r"(^|\.)bn\d*\.", r"(shortcut|downsample)\.1\.", "bias"]
+
 
 def load_optimizer(args, params, state=None, train_params: Params=None, train_loader=None):
+    """
+    `params` can also be (name, parameter) pairs, e.g. model.named_parameters(). LARS uses the
+    names for its exclusion lists, the other optimizers only get the parameters.
+    """
     scheduler = None
+    named_params = list(params)
+    if named_params and isinstance(named_params[0], tuple):
+        params = [p for _, p in named_params]
+    else:
+        params = named_params
     
     if train_params.optimizer == "SimCLR":
         optimizer = Adam(params, lr=train_params.lr, weight_decay=train_params.weight_decay)
@@ -44,11 +55,7 @@ def load_optimizer(args, params, state=None, train_params: Params=None, train_lo
             weight_decay=args.weight_decay,
         )
         # optimizer = LARC(optimizer=optimizer, trust_coefficient=0.001, clip=False)
-        warmup_lr_schedule = np.linspace(args.start_warmup, train_params.lr, len(train_loader) * args.warmup_epochs)
-        iters = np.arange(len(train_loader) * (train_params.epochs - args.warmup_epochs))
-        cosine_lr_schedule = np.array([args.final_lr + 0.5 * (train_params.lr - args.final_lr) * (1 + \
-                            math.cos(math.pi * t / (len(train_loader) * (train_params.epochs - args.warmup_epochs)))) for t in iters])
-        scheduler = np.concatenate((warmup_lr_schedule, cosine_lr_schedule))
+        scheduler = WarmupCosineSchedule(args, optimizer, train_params.lr, train_params.epochs, len(train_loader))
 
     elif train_params.optimizer == "Classifier":
         # set optimizer
@@ -75,10 +82,10 @@ def load_optimizer(args, params, state=None, train_params: Params=None, train_lo
         # (i.e. LearningRate = 0.3 × BatchSize/256) and weight decay of 10−6.
         lr = train_params.lr * train_params.batch_size/256
         optimizer = LARS(
-            params,
+            named_params,
             lr=lr,
             weight_decay=train_params.weight_decay,
-            exclude_from_weight_decay=["batch_normalization", "bias"],
+            exclude_from_weight_decay=LARS_EXCLUDE,
         )
 
         # "decay the learning rate with the cosine decay schedule without restarts"
@@ -90,30 +97,42 @@ def load_optimizer(args, params, state=None, train_params: Params=None, train_lo
 
     return optimizer, scheduler
 
-class SwAVScheduler():
-    def __init__(self, args, lr, epochs, loader, optimizer) -> None:
-        self.args = args
-        self.lr = lr
-        self.epochs = epochs
-        self.loader = loader
+class WarmupCosineSchedule():
+    """
+    Per iteration learning rate of SwAV: a linear warmup from start_warmup to lr over the
+    warmup_epochs, then a cosine decay to final_lr until the end of the run. The rate of an
+    iteration is computed in closed form from (epoch, step) when it is asked for, so nothing is
+    precomputed and there is no state to save: a restart resumes at any iteration by stepping
+    with its epoch. Past the end of the schedule it stays at final_lr.
+    """
+
+    def __init__(self, args, optimizer, lr, epochs, iters_per_epoch) -> None:
         self.optimizer = optimizer
-        self.build_schedule()
+        self.lr = lr
+        self.start_warmup = args.start_warmup
+        self.final_lr = args.final_lr
+        self.iters_per_epoch = iters_per_epoch
+        self.warmup_iters = iters_per_epoch * args.warmup_epochs
+        self.cosine_iters = iters_per_epoch * (epochs - args.warmup_epochs)
+
+    def __len__(self):
+        return self.warmup_iters + self.cosine_iters
+
+    def __getitem__(self, iteration):
+        if iteration < self.warmup_iters:
+            # same points as np.linspace(start_warmup, lr, warmup_iters)
+            if self.warmup_iters == 1:
+                return self.start_warmup
+            return self.start_warmup + (self.lr - self.start_warmup) * iteration / (self.warmup_iters - 1)
 
-    def build_schedule(self):
-        warmup_lr_schedule = np.linspace(self.args.start_warmup, self.lr, len(self.loader) * self.args.warmup_epochs)
-        iters = np.arange(len(self.loader) * (self.epochs - self.args.warmup_epochs))
-        cosine_lr_schedule = np.array([self.args.final_lr + 0.5 * (self.lr - self.args.final_lr) * (1 + \
-                            math.cos(math.pi * t / (len(self.loader) * (self.epochs - self.args.warmup_epochs)))) for t in iters])
-        self.scheduler = np.concatenate((warmup_lr_schedule, cosine_lr_schedule))
+        t = min(iteration - self.warmup_iters, self.cosine_iters)
+        return self.final_lr + 0.5 * (self.lr - self.final_lr) * (1 + math.cos(math.pi * t / max(self.cosine_iters, 1)))
 
     def step(self, epoch, step):
-        iteration = epoch * len(self.loader) + step
+        lr = self[epoch * self.iters_per_epoch + step]
 
-        if self.optimizer.param_groups[0]["lr"] < 1.0e-3 or iteration >= len(self.scheduler):
-            self.build_schedule()
+        for param_group in self.optimizer.param_groups:
+            param_group["lr"] = lr
 
-        try:
-            for param_group in self.optimizer.param_groups:
-                param_group["lr"] = self.scheduler[iteration]
-        except:
-            logging.error(f"IndexError: iteration {iteration}, scheduler length {len(self.scheduler)}")
\ No newline at end of file
+    def get_last_lr(self):
+        return [group["lr"] for group in self.optimizer.param_groups]
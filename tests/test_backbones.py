@@ -0,0 +1,18 @@
+import torch
+
+from models.backbones.resnet import resnet_backbone
+
+
+def test_cached_backbones_get_their_own_initialization():
+    first = resnet_backbone("resnet18", cached=True)
+    second = resnet_backbone("resnet18", cached=True)
+
+    assert first.state_dict().keys() == second.state_dict().keys()
+    assert not torch.equal(first.conv1.weight, second.conv1.weight)
+    assert not torch.equal(first.fc.weight, second.fc.weight)
+    assert torch.equal(first.bn1.weight, torch.ones_like(first.bn1.weight))
+
+    # same initialization scale as a backbone that is built from scratch
+    fresh = resnet_backbone("resnet18")
+    assert torch.allclose(first.conv1.weight.std(), fresh.conv1.weight.std(), rtol=0.1)
+    assert torch.allclose(first.fc.weight.std(), fresh.fc.weight.std(), rtol=0.1)
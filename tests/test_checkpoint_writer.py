@@ -0,0 +1,78 @@
+import types
+
+import pytest
+import torch
+
+import utils.checkpoint_writer as checkpoint_writer
+from utils.checkpoint_writer import flush_checkpoints, remove_checkpoint, save_checkpoint
+from utils.commons import simple_load_model, simple_save_model
+
+
+def make_args(tmp_path, asynchronous=True):
+    return types.SimpleNamespace(
+        checkpoint_async=asynchronous, checkpoint_max_in_flight=2, model_checkpoint_path=str(tmp_path))
+
+
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_saves_the_state_at_the_time_of_the_save(tmp_path, asynchronous):
+    path = str(tmp_path / "state.pth")
+    state = {"weights": torch.zeros(3), "epoch": 1, "history": [1]}
+
+    save_checkpoint(make_args(tmp_path, asynchronous), state, path)
+    # the training thread keeps going while the write is pending
+    state["weights"].add_(1)
+    state["epoch"] = 2
+    state["history"].append(2)
+    flush_checkpoints()
+
+    saved = torch.load(path)
+    assert torch.equal(saved["weights"], torch.zeros(3))
+    assert saved["epoch"] == 1 and saved["history"] == [1]
+    assert [p.name for p in tmp_path.iterdir()] == ["state.pth"]
+
+
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_failed_write_keeps_the_previous_checkpoint(tmp_path, monkeypatch, asynchronous):
+    args = make_args(tmp_path, asynchronous)
+    path = str(tmp_path / "state.pth")
+    save_checkpoint(args, {"epoch": 1}, path)
+    flush_checkpoints()
+
+    def interrupted_save(state, f):
+        with open(f, "wb") as out:
+            out.write(b"partial")
+        raise OSError("disk full")
+    monkeypatch.setattr(checkpoint_writer.torch, "save", interrupted_save)
+
+    if asynchronous:
+        save_checkpoint(args, {"epoch": 2}, path)
+        flush_checkpoints()
+    else:
+        with pytest.raises(OSError):
+            save_checkpoint(args, {"epoch": 2}, path)
+    monkeypatch.undo()
+
+    assert torch.load(path) == {"epoch": 1}
+
+
+def test_removal_waits_for_the_pending_write(tmp_path):
+    path = str(tmp_path / "state.pth")
+    save_checkpoint(make_args(tmp_path), {"epoch": 1}, path)
+    remove_checkpoint(path)
+    flush_checkpoints()
+
+    assert list(tmp_path.iterdir()) == []
+
+
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_simple_save_and_load_model(tmp_path, asynchronous):
+    args = make_args(tmp_path, asynchronous)
+    model = torch.nn.Linear(2, 2)
+
+    simple_save_model(args, model, "model.pth")
+    loaded = simple_load_model(args, "model.pth")
+
+    assert loaded.keys() == {"model"}
+    for name, value in model.state_dict().items():
+        assert torch.equal(loaded["model"][name], value)
+    assert simple_load_model(args, "missing.pth") is None
@@ -0,0 +1,89 @@
+import types
+
+import pytest
+import torch
+
+import utils.checkpointing as checkpointing
+from utils.checkpoint_writer import flush_checkpoints
+from utils.checkpointing import CheckpointManager
+
+
+def make_args(tmp_path, asynchronous=True):
+    return types.SimpleNamespace(
+        checkpoint_async=asynchronous, checkpoint_max_in_flight=2, model_checkpoint_path=str(tmp_path))
+
+
+def files(tmp_path):
+    flush_checkpoints()
+    return sorted(p.name for p in tmp_path.iterdir())
+
+
+@pytest.fixture
+def no_flush(monkeypatch):
+    # retention must never wait for the writer from the training thread
+    def fail():
+        raise AssertionError("flushed from the training thread")
+    monkeypatch.setattr(checkpointing, "flush_checkpoints", fail)
+
+
+@pytest.mark.parametrize("asynchronous", [True, False])
+def test_keep_recent_and_cadence(tmp_path, no_flush, asynchronous):
+    model = torch.nn.Linear(2, 2)
+    manager = CheckpointManager(
+        make_args(tmp_path, asynchronous), tmp_path, filename="ckpt_{}.tar",
+        keep_recent=2, save_every=3, best_filename=None, model=model)
+
+    for epoch in range(1, 11):
+        manager.step(epoch)
+    manager.step(10, force=True, keep=True)
+
+    assert files(tmp_path) == ["ckpt_10.tar", "ckpt_6.tar", "ckpt_9.tar"]
+
+
+def test_best_checkpoint_replaces_the_previous_one(tmp_path, no_flush):
+    model = torch.nn.Linear(2, 2)
+    manager = CheckpointManager(make_args(tmp_path), tmp_path, save_every=0, best_filename="proxy_{}.pth")
+
+    for batch, acc in [(0, 10.), (0, 12.), (1, 11.), (1, 15.), (2, 14.)]:
+        manager.step(batch, acc, model=model)
+
+    assert files(tmp_path) == ["proxy_1.pth"]
+    assert torch.load(tmp_path / "proxy_1.pth")["best_metric"] == 15.
+
+
+def test_final_checkpoint_on_the_cadence_is_written_once(tmp_path, monkeypatch):
+    writes = []
+    monkeypatch.setattr(checkpointing, "save_checkpoint", lambda args, state, path: writes.append(path))
+
+    manager = CheckpointManager(
+        make_args(tmp_path), tmp_path, filename="ckpt_{}.tar",
+        keep_recent=1, save_every=5, best_filename=None, model=torch.nn.Linear(2, 2))
+
+    for epoch in range(1, 11):
+        manager.step(epoch)
+    final = manager.step(10, force=True, keep=True)
+
+    assert final == str(tmp_path / "ckpt_10.tar")
+    assert writes == [str(tmp_path / "ckpt_5.tar"), str(tmp_path / "ckpt_10.tar")]
+
+    # the final checkpoint left the retention, a later save doesn't remove it
+    manager.step(15)
+    assert 10 not in manager._recent_iterations
+
+
+def test_extra_values_and_older_checkpoints(tmp_path):
+    model = torch.nn.Linear(2, 2)
+    manager = CheckpointManager(
+        make_args(tmp_path), tmp_path, filename="classifier_checkpoint_{}.pth",
+        best_filename="classifier_best.pth", state_dict=model)
+
+    manager.step(3, metric=40., extra={"epoch": 3, "best_acc": 40.})
+    flush_checkpoints()
+    saved = torch.load(tmp_path / "classifier_checkpoint_3.pth")
+    assert saved["epoch"] == 3 and saved["best_acc"] == 40. and saved["iteration"] == 3
+
+    # a checkpoint saved before the manager, without iteration and best_metric
+    torch.save({"epoch": 7, "state_dict": model.state_dict(), "best_acc": 55.}, tmp_path / "old.pth")
+    resumed = CheckpointManager(make_args(tmp_path), tmp_path, state_dict=torch.nn.Linear(2, 2))
+    assert resumed.load(str(tmp_path / "old.pth")) == 7
+    assert resumed._best_metric == 55.
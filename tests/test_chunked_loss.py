@@ -0,0 +1,79 @@
+from types import SimpleNamespace
+
+import pytest
+import torch
+import torch.nn.functional as F
+
+from models.self_sup.simclr.loss.chunked_loss import contrastive_logsumexp
+from models.self_sup.simclr.loss.dcl_loss import DCL
+from models.self_sup.simclr.loss.nt_xent_loss import NTXentLoss
+
+
+def loss_args(chunk_size, use_checkpoint=False):
+    return SimpleNamespace(temperature=0.5, contrastive_chunk_size=chunk_size, contrastive_checkpoint=use_checkpoint)
+
+
+def dense_logsumexp(anchor, contrast, temperature, exclude_offsets):
+    logits = anchor @ contrast.t() / temperature
+    rows = torch.arange(anchor.size(0))
+    for offset in exclude_offsets:
+        logits[rows, (rows + offset) % contrast.size(0)] = float("-inf")
+    return torch.logsumexp(logits, dim=1)
+
+
+def values_and_grads(loss_fn, *inputs):
+    inputs = [x.detach().clone().requires_grad_() for x in inputs]
+    loss = loss_fn(*inputs)
+    loss.sum().backward()
+    return loss.detach(), [x.grad for x in inputs]
+
+
+def assert_same(fn1, fn2, *inputs):
+    loss1, grads1 = values_and_grads(fn1, *inputs)
+    loss2, grads2 = values_and_grads(fn2, *inputs)
+
+    assert torch.allclose(loss1, loss2, atol=1e-5)
+    for g1, g2 in zip(grads1, grads2):
+        assert torch.allclose(g1, g2, atol=1e-5)
+
+
+# chunk sizes that don't divide the 10 rows / 20 columns, one chunk and one row per chunk
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 64])
+@pytest.mark.parametrize("use_checkpoint", [False, True])
+def test_logsumexp_matches_the_dense_one(chunk_size, use_checkpoint):
+    torch.manual_seed(0)
+    anchor = F.normalize(torch.randn(10, 8), dim=1)
+    contrast = F.normalize(torch.randn(20, 8), dim=1)
+
+    assert_same(
+        lambda a, c: contrastive_logsumexp(a, c, 0.5, (0, 10), chunk_size=chunk_size, use_checkpoint=use_checkpoint),
+        lambda a, c: dense_logsumexp(a, c, 0.5, (0, 10)),
+        anchor, contrast)
+
+
+def test_rows_with_every_column_of_a_chunk_left_out():
+    # with one column per chunk, the first chunk of row 0 is only its left out column
+    anchor = torch.randn(4, 3)
+    out = contrastive_logsumexp(anchor, anchor, 1.0, (0,), chunk_size=1)
+
+    assert torch.isfinite(out).all()
+    assert torch.allclose(out, dense_logsumexp(anchor, anchor, 1.0, (0,)), atol=1e-5)
+
+
+@pytest.mark.parametrize("use_checkpoint", [False, True])
+def test_nt_xent_matches_the_dense_loss(use_checkpoint):
+    torch.manual_seed(0)
+    features = F.normalize(torch.randn(6, 3, 8), dim=2)
+
+    assert_same(NTXentLoss(loss_args(4, use_checkpoint)), NTXentLoss(loss_args(0)), features)
+
+
+@pytest.mark.parametrize("use_checkpoint", [False, True])
+def test_dcl_matches_the_dense_loss(use_checkpoint):
+    torch.manual_seed(0)
+    z1 = F.normalize(torch.randn(6, 8), dim=1)
+    z2 = F.normalize(torch.randn(6, 8), dim=1)
+    chunked, dense = DCL(loss_args(4, use_checkpoint)), DCL(loss_args(0))
+
+    assert_same(chunked, dense, z1, z2)
+    assert_same(chunked.symmetric, dense.symmetric, z1, z2)
@@ -0,0 +1,50 @@
+import os
+import types
+
+import pytest
+
+from datautils.dataset_index import get_manifest_path, load_class_index
+
+
+@pytest.fixture
+def args(tmp_path):
+    misc = tmp_path / "misc"
+    misc.mkdir()
+    return types.SimpleNamespace(model_misc_path=str(misc))
+
+
+def make_classes(root, names):
+    for name in names:
+        (root / name).mkdir(parents=True)
+
+
+def touch(root, mtime):
+    # new folders can land in the same mtime tick on coarse filesystems
+    os.utime(root, ns=(mtime, mtime))
+
+
+def test_class_index_follows_class_folder_changes(tmp_path, args):
+    root = tmp_path / "images"
+    make_classes(root, ["cat", "dog"])
+    touch(root, 10**18)
+
+    assert load_class_index(args, str(root)) == {"cat": 0, "dog": 1}
+
+    make_classes(root, ["ant"])
+    touch(root, 10**18 + 1)
+    assert load_class_index(args, str(root)) == {"ant": 0, "cat": 1, "dog": 2}
+
+    os.rename(root / "dog", root / "wolf")
+    touch(root, 10**18 + 2)
+    assert load_class_index(args, str(root)) == {"ant": 0, "cat": 1, "wolf": 2}
+
+
+def test_manifest_names(args, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    name = lambda root: os.path.basename(get_manifest_path(args, root, "files.npz"))
+
+    assert name("./datasets/food") == name("datasets/food/") == name(str(tmp_path / "datasets/food"))
+    assert name("./datasets/food.") != name("./datasets/food")
+    assert name("../data") != name("./data")
+    assert name("a_b/c") != name("a/b_c")
+    assert name("./datasets/food").startswith("food_")
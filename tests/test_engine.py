@@ -0,0 +1,38 @@
+from types import SimpleNamespace
+
+import torch
+
+from models.trainers.engine import TrainingEngine
+
+
+def make_engine(log_step, verbose=True):
+    args = SimpleNamespace(device="cpu", precision="off", cpu_channels_last=False, log_step=log_step)
+    model = torch.nn.Linear(2, 1)
+    optimizer = torch.optim.SGD(model.parameters(), lr=0.1)
+    return TrainingEngine(args, model, optimizer, verbose=verbose)
+
+
+def run_epoch(engine, monkeypatch, n_batches=6, **kwargs):
+    logged = []
+    monkeypatch.setattr(engine, "log", lambda epoch, step, *_: logged.append(step))
+
+    def compute_loss(batch, epoch, step):
+        return engine.model(batch).pow(2).mean()
+
+    hook_steps = []
+    loader = [torch.randn(3, 2) for _ in range(n_batches)]
+    engine.train_epoch(loader, 0, compute_loss, before_step=lambda epoch, step: hook_steps.append(step), **kwargs)
+    return logged, hook_steps
+
+
+def test_logs_with_the_global_step(monkeypatch):
+    logged, hook_steps = run_epoch(make_engine(log_step=4), monkeypatch, step_offset=10)
+
+    assert logged == [12]
+    assert hook_steps == list(range(6))
+
+
+def test_no_log_lines_when_not_verbose(monkeypatch):
+    logged, _ = run_epoch(make_engine(log_step=1, verbose=False), monkeypatch)
+
+    assert logged == []
@@ -0,0 +1,52 @@
+import os
+import types
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from datautils.image_shards import get_shard_store, load_image, prepare_shards
+
+
+@pytest.fixture
+def args(tmp_path):
+    misc = tmp_path / "misc"
+    misc.mkdir()
+    return types.SimpleNamespace(
+        model_misc_path=str(misc), image_cache_dir=str(tmp_path / "cache"),
+        image_cache_shard_mb=1, image_cache_max_side=64, log_step=1000)
+
+
+def write_image(path, value):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.fromarray(np.full((8, 8, 3), value, dtype=np.uint8)).save(path)
+
+
+def pixel(img):
+    return np.asarray(img)[0, 0, 0]
+
+
+def never_decoded(path):
+    raise AssertionError(f"{path} was decoded from disk")
+
+
+def test_cached_images_are_served_until_their_source_changes(tmp_path, args):
+    root = tmp_path / "images"
+    write_image(root / "cat" / "a.png", 10)
+    write_image(root / "dog" / "b.png", 20)
+
+    assert get_shard_store(args) is None
+
+    # the cache built after a lookup found no index is picked up
+    prepare_shards(args, str(root), workers=1)
+    assert get_shard_store(args) is not None
+
+    assert pixel(load_image(args, str(root / "cat" / "a.png"), never_decoded)) == 10
+    assert pixel(load_image(args, str(root / "dog" / "b.png"), never_decoded)) == 20
+
+    write_image(root / "cat" / "a.png", 30)
+    stat = os.stat(root / "cat" / "a.png")
+    os.utime(root / "cat" / "a.png", ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert pixel(load_image(args, str(root / "cat" / "a.png"), Image.open)) == 30
+    assert pixel(load_image(args, str(root / "dog" / "b.png"), never_decoded)) == 20
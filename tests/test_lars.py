@@ -0,0 +1,101 @@
+import re
+
+import pytest
+import torch
+import torch.nn as nn
+
+from optim.lars import LARS
+from optim.optimizer import LARS_EXCLUDE
+
+
+class Block(nn.Module):
+    def __init__(self) -> None:
+        super().__init__()
+        self.conv1 = nn.Conv2d(3, 4, 3)
+        self.bn1 = nn.BatchNorm2d(4)
+        self.downsample = nn.Sequential(nn.Conv2d(3, 4, 1, bias=False), nn.BatchNorm2d(4))
+        self.fc = nn.Linear(4, 2)
+
+
+def excluded(name):
+    return any(re.search(r, name) is not None for r in LARS_EXCLUDE)
+
+
+def reference_step(named_params, buffers, lr, momentum, weight_decay, eeta, use_nesterov):
+    """The per parameter update of the TensorFlow LARS optimizer"""
+    for name, p in named_params:
+        grad = p.grad.clone()
+        if not excluded(name):
+            grad += weight_decay * p.data
+
+        scaled_lr = lr
+        if not excluded(name):
+            w_norm, g_norm = torch.norm(p.data), torch.norm(grad)
+            if w_norm > 0 and g_norm > 0:
+                scaled_lr = lr * eeta * w_norm / g_norm
+
+        v = buffers.setdefault(name, torch.zeros_like(p))
+        v.mul_(momentum).add_(scaled_lr * grad)
+        update = momentum * v + scaled_lr * grad if use_nesterov else v
+        p.data.sub_(update)
+
+
+def set_grads(model, seed):
+    generator = torch.Generator().manual_seed(seed)
+    for name, p in model.named_parameters():
+        p.grad = torch.randn(p.shape, generator=generator)
+    # a parameter with a zero gradient keeps the plain learning rate
+    model.fc.weight.grad.zero_()
+
+
+@pytest.mark.parametrize("use_nesterov", [False, True])
+def test_step_matches_the_per_parameter_update(use_nesterov):
+    torch.manual_seed(0)
+    model = Block()
+    # a parameter with a zero norm keeps the plain learning rate
+    nn.init.zeros_(model.conv1.weight)
+    reference = Block()
+    reference.load_state_dict(model.state_dict())
+
+    hyper = dict(lr=0.5, momentum=0.9, weight_decay=0.1, eeta=0.001, use_nesterov=use_nesterov)
+    optimizer = LARS(model.named_parameters(), exclude_from_weight_decay=LARS_EXCLUDE, **hyper)
+    buffers = {}
+
+    for seed in range(3):
+        set_grads(model, seed)
+        set_grads(reference, seed)
+        optimizer.step()
+        reference_step(list(reference.named_parameters()), buffers, **hyper)
+
+        for (name, p), q in zip(model.named_parameters(), reference.parameters()):
+            assert torch.allclose(p, q, atol=1e-6), name
+
+
+def test_exclusions():
+    model = Block()
+    names = [name for name, _ in model.named_parameters()]
+
+    assert sorted(n for n in names if excluded(n)) == sorted([
+        "conv1.bias", "bn1.weight", "bn1.bias", "downsample.1.weight", "downsample.1.bias", "fc.bias"])
+
+
+def test_parameters_without_gradient_are_skipped():
+    torch.manual_seed(0)
+    model = Block()
+    reference = Block()
+    reference.load_state_dict(model.state_dict())
+    optimizer = LARS(model.named_parameters(), lr=0.5, weight_decay=0.1, exclude_from_weight_decay=LARS_EXCLUDE)
+    buffers = {}
+
+    for seed, frozen in enumerate([False, True, False]):
+        set_grads(model, seed)
+        set_grads(reference, seed)
+        if frozen:
+            model.conv1.weight.grad = None
+        optimizer.step()
+        reference_step(
+            [(n, p) for n, p in reference.named_parameters() if not (frozen and n == "conv1.weight")],
+            buffers, lr=0.5, momentum=0.9, weight_decay=0.1, eeta=0.001, use_nesterov=False)
+
+        for (name, p), q in zip(model.named_parameters(), reference.parameters()):
+            assert torch.allclose(p, q, atol=1e-6), name
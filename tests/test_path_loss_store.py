@@ -0,0 +1,74 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from datautils.path_loss import PathLoss
+from datautils.path_loss_store import PathLossStore
+
+PATHS = [f"/data/class_{i % 3}/img_{i}.png" for i in range(10)] + ["/data/ünïcode/é.png"]
+LOSSES = [float(i) / 4 for i in range(len(PATHS))]
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PathLossStore.write(str(tmp_path / "store"), PATHS, LOSSES)
+
+
+def as_tuples(items):
+    return [(item.path, item.loss) for item in items]
+
+
+def test_round_trip(store, tmp_path):
+    reopened = PathLossStore(str(tmp_path / "store"))
+
+    assert PathLossStore.exists(str(tmp_path / "store"))
+    assert len(reopened) == len(PATHS)
+    assert as_tuples(reopened) == list(zip(PATHS, LOSSES))
+    assert isinstance(reopened[0], PathLoss)
+
+
+def test_write_replaces_the_previous_store(store, tmp_path):
+    PathLossStore.write(str(tmp_path / "store"), PATHS[:2], LOSSES[:2])
+
+    assert as_tuples(PathLossStore(str(tmp_path / "store"))) == list(zip(PATHS[:2], LOSSES[:2]))
+
+
+def test_empty_store(tmp_path):
+    empty = PathLossStore.write(str(tmp_path / "empty"), [], [])
+
+    assert len(empty) == 0
+    assert list(empty) == []
+
+
+@pytest.mark.parametrize("first, second", [
+    (slice(2, 9), slice(1, 4)),
+    (slice(None, None, -1), slice(0, 5)),
+    (slice(1, None, 2), slice(None, None, -1)),
+    (slice(5, 5), slice(None)),
+])
+def test_slices_are_views_like_lists(store, first, second):
+    expected = list(zip(PATHS, LOSSES))[first][second]
+    view = store[first][second]
+
+    assert len(view) == len(expected)
+    assert as_tuples(view) == expected
+    np.testing.assert_array_equal(view.column("loss"), np.float32([loss for _, loss in expected]))
+
+
+def test_add_column(store):
+    store.add_column("entropy", np.arange(len(PATHS), dtype=np.float32))
+
+    assert store.column_names() == ["entropy", "loss"]
+    np.testing.assert_array_equal(store[3:6].column("entropy"), [3, 4, 5])
+
+    with pytest.raises(ValueError):
+        store.add_column("short", [1.0])
+
+
+def test_pickling_reopens_the_memory_maps(store):
+    store.column("loss")
+    view = pickle.loads(pickle.dumps(store[4:8]))
+
+    assert view._offsets is None and view._columns == {}
+    assert as_tuples(view) == list(zip(PATHS, LOSSES))[4:8]
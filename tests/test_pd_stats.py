@@ -0,0 +1,33 @@
+import gc
+import weakref
+
+from models.utils.logger import PD_Stats
+
+
+def test_buffered_rows_are_written_when_the_stats_are_dropped(tmp_path):
+    path = str(tmp_path / "stats.jsonl")
+    stats = PD_Stats(path, ["epoch", "loss"])
+    stats.update([0, 1.5], save=False)
+    stats.update([1, 1.25], save=False)
+    assert not (tmp_path / "stats.jsonl").exists()
+
+    ref = weakref.ref(stats)
+    del stats
+    gc.collect()
+
+    # nothing registered at exit keeps the stats alive
+    assert ref() is None
+    assert PD_Stats(path, ["epoch", "loss"]).stats.values.tolist() == [[0, 1.5], [1, 1.25]]
+
+
+def test_close_writes_the_buffer_once(tmp_path):
+    path = str(tmp_path / "stats.jsonl")
+    stats = PD_Stats(path, ["epoch", "loss"])
+    stats.update([0, 1.5], save=False)
+    stats.close()
+    stats.close()
+
+    assert (tmp_path / "stats.jsonl").read_text().count("\n") == 1
+
+    stats.update([1, 1.25])
+    assert stats.stats.values.tolist() == [[0, 1.5], [1, 1.25]]
@@ -0,0 +1,65 @@
+import torch
+
+from models.self_sup.swav.queue import SwAVQueue
+
+
+def push_all(queue, sizes, dim=4):
+    pushed = []
+    for bs in sizes:
+        batch = torch.randn(queue.embeddings.size(0), bs, dim)
+        queue.push(batch)
+        pushed.append(batch)
+    return torch.cat(pushed, dim=1)
+
+
+def in_push_order(queue):
+    # the oldest row is at the write pointer once the queue has wrapped around
+    return torch.roll(queue.embeddings, -queue.ptr, dims=1)
+
+
+def test_batches_that_do_not_divide_the_length_wrap_around():
+    queue = SwAVQueue(2, 768, 4, "cpu")
+    pushed = push_all(queue, [256, 256, 232, 256])
+
+    assert queue.full
+    assert queue.ptr == (256 + 256 + 232 + 256) % 768
+    assert torch.equal(in_push_order(queue), pushed[:, -768:])
+
+
+def test_filled_counter():
+    queue = SwAVQueue(1, 10, 4, "cpu")
+    push_all(queue, [4])
+    assert queue.filled == 4 and not queue.full
+
+    push_all(queue, [4, 4])
+    assert queue.filled == 10 and queue.full
+
+
+def test_batch_longer_than_the_queue_keeps_its_last_rows():
+    queue = SwAVQueue(1, 6, 4, "cpu")
+    pushed = push_all(queue, [3, 8])
+
+    assert torch.equal(in_push_order(queue), pushed[:, -6:])
+
+
+def test_state_dict_round_trip():
+    queue = SwAVQueue(2, 12, 4, "cpu")
+    push_all(queue, [5, 5])
+
+    restored = SwAVQueue(2, 12, 4, "cpu")
+    restored.load_state_dict(queue.state_dict())
+
+    assert (restored.ptr, restored.filled) == (queue.ptr, queue.filled)
+    assert torch.equal(restored.embeddings, queue.embeddings)
+
+
+def test_legacy_queue_is_reordered_oldest_first():
+    # the shifting queue kept the newest rows first and zeros in the rows not filled yet
+    legacy = torch.zeros(1, 6, 2)
+    legacy[0, :4] = torch.tensor([[4., 4.], [3., 3.], [2., 2.], [1., 1.]])
+
+    queue = SwAVQueue(1, 6, 2, "cpu")
+    queue.load_state_dict({"queue": legacy})
+
+    assert (queue.ptr, queue.filled) == (4, 4)
+    assert torch.equal(queue.embeddings[0, :4, 0], torch.tensor([1., 2., 3., 4.]))
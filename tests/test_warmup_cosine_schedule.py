@@ -0,0 +1,58 @@
+import math
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+import torch
+
+from optim.optimizer import WarmupCosineSchedule
+
+
+def make_schedule(warmup_epochs=2, epochs=5, iters_per_epoch=7, lr=0.6):
+    args = SimpleNamespace(start_warmup=0.01, final_lr=0.0006, warmup_epochs=warmup_epochs)
+    optimizer = torch.optim.SGD([torch.zeros(1, requires_grad=True)], lr=lr)
+    return WarmupCosineSchedule(args, optimizer, lr, epochs, iters_per_epoch), args
+
+
+def precomputed(args, lr, epochs, iters_per_epoch):
+    # the arrays the schedule replaced
+    warmup_lr_schedule = np.linspace(args.start_warmup, lr, iters_per_epoch * args.warmup_epochs)
+    iters = np.arange(iters_per_epoch * (epochs - args.warmup_epochs))
+    cosine_lr_schedule = np.array([args.final_lr + 0.5 * (lr - args.final_lr) * (1 + \
+                        math.cos(math.pi * t / (iters_per_epoch * (epochs - args.warmup_epochs)))) for t in iters])
+    return np.concatenate((warmup_lr_schedule, cosine_lr_schedule))
+
+
+@pytest.mark.parametrize("warmup_epochs", [0, 2])
+def test_matches_the_precomputed_schedule(warmup_epochs):
+    schedule, args = make_schedule(warmup_epochs=warmup_epochs)
+    expected = precomputed(args, 0.6, 5, 7)
+
+    assert len(schedule) == len(expected)
+    assert np.allclose([schedule[i] for i in range(len(schedule))], expected)
+
+
+def test_stays_at_final_lr_past_the_end():
+    schedule, args = make_schedule()
+
+    assert schedule[len(schedule)] == pytest.approx(args.final_lr)
+    assert schedule[len(schedule) + 100] == pytest.approx(args.final_lr)
+
+
+def test_step_sets_the_lr_of_the_iteration():
+    schedule, _ = make_schedule()
+    schedule.step(3, 4)
+
+    assert schedule.get_last_lr() == [schedule[3 * 7 + 4]]
+    assert schedule.optimizer.param_groups[0]["lr"] == schedule[3 * 7 + 4]
+
+
+def test_a_new_schedule_resumes_at_any_iteration():
+    schedule, _ = make_schedule()
+    for epoch in range(3):
+        for step in range(7):
+            schedule.step(epoch, step)
+
+    resumed, _ = make_schedule()
+    resumed.step(2, 6)
+    assert resumed.get_last_lr() == schedule.get_last_lr()
@@ -0,0 +1,51 @@
+'''
+Copy of the best weights of a model so far, kept in CPU memory.
+
+Only the state_dict tensors are copied, into buffers allocated on the first copy (pinned when
+the model is on the GPU, so the copies are non-blocking) and reused by every later one. The
+copies are only waited for when the weights are read back.
+'''
+
+import torch
+
+
+class BestWeights():
+    def __init__(self, model) -> None:
+        self.model = model
+        self.buffers = None
+        self.event = None
+
+    def update(self, model=None):
+        """Copies the current weights of the model into the buffers"""
+        state = (model if model is not None else self.model).state_dict()
+
+        if self.buffers is None or self.buffers.keys() != state.keys():
+            self.buffers = {
+                k: torch.empty(v.size(), dtype=v.dtype, pin_memory=v.is_cuda)
+                for k, v in state.items()
+            }
+
+        for k, v in state.items():
+            self.buffers[k].copy_(v.detach(), non_blocking=True)
+
+        self.event = None
+        if any(v.is_cuda for v in state.values()):
+            self.event = torch.cuda.Event()
+            self.event.record()
+
+    def state_dict(self):
+        """The best weights, the current ones of the model if there was no update yet"""
+        if self.buffers is None:
+            self.update()
+
+        if self.event is not None:
+            self.event.synchronize()
+
+        return self.buffers
+
+    def restore(self, model=None):
+        """Loads the best weights back into the model"""
+        model = model if model is not None else self.model
+        model.load_state_dict(self.state_dict())
+
+        return model
@@ -0,0 +1,124 @@
+'''
+Checkpoint writes off the training thread.
+
+A save takes a snapshot of the state (every tensor copied to CPU memory, pinned and with
+non-blocking copies when it comes from the GPU) and hands it to a background thread that
+serializes it to a temporary file and renames it over the checkpoint, so a checkpoint on disk is
+always complete. Removals of old checkpoints are queued behind the writes on the same thread. At
+most `checkpoint_max_in_flight` snapshots are waiting to be written, a save past that waits for
+the oldest one. Pending writes are flushed before a checkpoint is loaded and
+when the process exits.
+'''
+
+import atexit
+import copy
+import os
+import queue
+import threading
+
+import torch
+
+import utils.logger as logging
+
+
+def snapshot(state):
+    """Copy of a (nested) state with every tensor in CPU memory"""
+    if torch.is_tensor(state):
+        if state.device.type == "cuda":
+            out = torch.empty(state.size(), dtype=state.dtype, pin_memory=True)
+            return out.copy_(state.detach(), non_blocking=True)
+        return state.detach().clone()
+
+    if isinstance(state, dict):
+        return type(state)((k, snapshot(v)) for k, v in state.items())
+
+    if isinstance(state, (list, tuple)):
+        return type(state)(snapshot(v) for v in state)
+
+    return copy.deepcopy(state)
+
+
+def write_atomic(state, path):
+    tmp = path + ".tmp"
+    torch.save(state, tmp)
+    os.replace(tmp, path)
+
+
+def remove_file(path):
+    if os.path.isfile(path):
+        os.remove(path)
+
+
+class CheckpointWriter():
+    def __init__(self, max_in_flight=2) -> None:
+        self.pending = queue.Queue()
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.thread = threading.Thread(target=self.run, name="checkpoint-writer", daemon=True)
+        self.thread.start()
+        atexit.register(self.flush)
+
+    def save(self, state, path):
+        self.slots.acquire()
+        state = snapshot(state)
+
+        # the copies from the GPU are done once the writer thread has waited for this event
+        event = None
+        if torch.cuda.is_available() and torch.cuda.is_initialized():
+            event = torch.cuda.Event()
+            event.record()
+
+        self.pending.put((state, event, path))
+
+    def remove(self, path):
+        """Removes `path` once the writes queued before are done, without waiting for them"""
+        self.pending.put((None, None, path))
+
+    def run(self):
+        while True:
+            state, event, path = self.pending.get()
+            try:
+                if state is None:
+                    remove_file(path)
+                else:
+                    if event is not None:
+                        event.synchronize()
+                    write_atomic(state, path)
+            except Exception as er:
+                logging.error(f"Failed to {'remove' if state is None else 'write'} the checkpoint {path}: {er}")
+            finally:
+                if state is not None:
+                    self.slots.release()
+                self.pending.task_done()
+
+    def flush(self):
+        """Blocks until every pending checkpoint is on disk"""
+        self.pending.join()
+
+
+_writer = None
+
+
+def save_checkpoint(args, state, path):
+    """Saves `state` to `path`, in the background unless checkpoint_async is off"""
+    global _writer
+
+    if not args.checkpoint_async:
+        write_atomic(state, path)
+        return
+
+    if _writer is None:
+        _writer = CheckpointWriter(args.checkpoint_max_in_flight)
+    _writer.save(state, path)
+
+
+def remove_checkpoint(path):
+    """Removes a checkpoint after the pending writes, in the background when they are"""
+    if _writer is None:
+        remove_file(path)
+    else:
+        _writer.remove(path)
+
+
+def flush_checkpoints():
+    if _writer is not None:
+        _writer.flush()
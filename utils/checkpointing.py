@@ -12,12 +12,16 @@ This handles saving and loading of checkpoints
 
 import copy
 import pathlib
+import shutil
 from typing import Any, Dict, List, Optional
 
 # from loguru import logger
 import torch
 from torch import nn
 
+from utils.checkpoint_writer import flush_checkpoints, remove_checkpoint, save_checkpoint
+import utils.logger as logging
+
 # import virtex.utils.distributed as dist
 
 
@@ -26,7 +30,8 @@ class CheckpointManager:
     A helper class to periodically serialize models and other checkpointable
     objects (optimizers, LR schedulers etc., which implement ``state_dict``
     method) during training, and optionally record best performing checkpoint
-    based on an observed metric.
+    based on an observed metric. The files are written in the background by
+    :mod:`utils.checkpoint_writer`.
 
     .. note::
 
@@ -39,48 +44,73 @@ class CheckpointManager:
         better", flip the sign if otherwise.
 
     Args:
+        args: Run config, it selects synchronous or background writes.
         serialization_dir: Path to a directory to save checkpoints.
-        keep_recent: Number of recent ``k`` checkpoints to keep on disk. Older
-            checkpoints will be removed. Set to a very large value for keeping
-            all checkpoints.
+        filename: Name of the checkpoints, ``{}`` is replaced by the iteration.
+        keep_recent: Number of recent ``k`` periodic checkpoints to keep on
+            disk. Older checkpoints will be removed. Checkpoints saved with
+            ``keep=True`` don't count and are never removed.
+        save_every: Periodic checkpoints are saved every ``save_every``
+            iterations, 0 only saves the forced ones.
+        best_filename: Name of the best checkpoint, ``None`` to not keep one. If
+            it has a ``{}``, it is replaced by the iteration and the previous
+            best checkpoint is removed when a better one is saved.
         checkpointables: Keyword arguments with any checkpointable objects, for
             example: model, optimizer, learning rate scheduler.
 
     Examples:
         >>> model = torch.nn.Linear(10, 2)
         >>> optimizer = torch.optim.Adam(model.parameters())
-        >>> ckpt_manager = CheckpointManager("/tmp", model=model, optimizer=optimizer)
+        >>> ckpt_manager = CheckpointManager(args, "/tmp", model=model, optimizer=optimizer)
         >>> num_epochs = 20
         >>> for epoch in range(num_epochs):
         ...     train(model)
         ...     val_loss = validate(model)
-        ...     ckpt_manager.step(- val_loss, epoch)
+        ...     ckpt_manager.step(epoch, - val_loss)
     """
 
     def __init__(
         self,
+        args: Any,
         serialization_dir: str = "/tmp",
+        filename: str = "checkpoint_{}.pth",
         keep_recent: int = 200,
+        save_every: int = 1,
+        best_filename: Optional[str] = "checkpoint_best.pth",
         **checkpointables: Any,
     ):
+        self.args = args
         self.serialization_dir = pathlib.Path(serialization_dir)
+        self.serialization_dir.mkdir(parents=True, exist_ok=True)
+        self.filename = filename
         self.keep_recent = keep_recent
+        self.save_every = save_every
+        self.best_filename = best_filename
 
         # Shallow copy, keeps references to tensors as original objects.
         self.checkpointables = copy.copy(checkpointables)
 
-        # Initialize members to hold state dict of best checkpoint and its
-        # performance.
+        # Initialize members to hold the best performance and the file of the
+        # best checkpoint.
         self._best_metric: float = -1e-12
-        self._best_ckpt: Dict[str, Any] = {}
+        self._best_path: Optional[pathlib.Path] = None
 
         # Keep epoch/iteration numbers of recently saved 'k' checkpoints.
         self._recent_iterations: List[int] = []
+        self._last_saved: Optional[int] = None
+
+    def path(self, iteration: int) -> pathlib.Path:
+        return self.serialization_dir / self.filename.format(iteration)
+
+    def should_save(self, iteration: int) -> bool:
+        return self.save_every > 0 and iteration % self.save_every == 0
 
-    def step(self, iteration: int, metric: Optional[float] = None):
+    def step(self, iteration: int, metric: Optional[float] = None, force: bool = False, keep: bool = False,
+             extra: Optional[Dict[str, Any]] = None, **checkpointables: Any):
         r"""
-        Serialize checkpoint and update best checkpoint based on metric. Keys
-        in serialized checkpoint match those in :attr:`checkpointables`.
+        Serialize checkpoint if ``iteration`` is on the cadence (or ``force``)
+        and update best checkpoint based on metric. Keys in serialized
+        checkpoint match those in :attr:`checkpointables`.
 
         Args:
             iteration: Current training iteration. Will be saved with other
@@ -88,45 +118,107 @@ class CheckpointManager:
             metric: Observed metric (higher is better) for keeping track of the
                 best checkpoint. If this is ``None``, best chckpoint will not be
                 recorded/updated.
+            force: Save a checkpoint even if ``iteration`` is not on the cadence.
+            keep: Leave this checkpoint out of the ``keep_recent`` retention,
+                e.g. for the final checkpoint of a run.
+            extra: Plain values saved as they are next to the state dicts, e.g.
+                the ``epoch`` and ``best_acc`` keys read by older resume code.
+            checkpointables: Replace the checkpointables of the manager for this
+                step.
+
+        Returns:
+            Path of the checkpoint saved for this iteration, ``None`` if only the
+            best checkpoint (or nothing) was saved.
         """
 
-        checkpointable_state_dict: Dict[str, Any] = self._state_dict()
+        periodic = force or self.should_save(iteration)
+        is_best = self.best_filename is not None and metric is not None and metric > self._best_metric
+
+        # The checkpoint of this iteration was saved by the previous step (e.g.
+        # the final checkpoint of a run falls on the cadence), only its
+        # retention can change.
+        if periodic and iteration == self._last_saved:
+            periodic = False
+            if keep and iteration in self._recent_iterations:
+                self._recent_iterations.remove(iteration)
+            if not is_best:
+                return str(self.path(iteration))
+
+        if not periodic and not is_best:
+            return None
+
+        checkpointable_state_dict: Dict[str, Any] = self._state_dict(checkpointables)
+
+        checkpointable_state_dict.update(extra or {})
 
         # We also checkpoint current iteration.
         checkpointable_state_dict["iteration"] = iteration
 
-        # Update the best checkpoint based on metric, if provided.
-        if metric is not None and metric > self._best_metric:
+        # Serialize best performing checkpoint observed so far.
+        if is_best:
             self._best_metric = metric
-            self._best_ckpt = copy.copy(checkpointable_state_dict)
+            checkpointable_state_dict["best_metric"] = metric
+
+            best_path = self.serialization_dir / self.best_filename.format(iteration)
+            if self._best_path is not None and self._best_path != best_path:
+                self._remove(self._best_path)
+            save_checkpoint(self.args, checkpointable_state_dict, str(best_path))
+            self._best_path = best_path
+
+        if not periodic:
+            return str(self.path(iteration)) if iteration == self._last_saved else None
 
         # Serialize checkpoint corresponding to current iteration.
-        torch.save(
-            checkpointable_state_dict,
-            self.serialization_dir / f"checkpoint_{iteration}.pth",
-        )
-        if self._best_metric != -1e-12:
-            # Serialize best performing checkpoint observed so far.
-            torch.save(
-                self._best_ckpt, self.serialization_dir / "checkpoint_best.pth"
-            )
+        path = self.path(iteration)
+        save_checkpoint(self.args, checkpointable_state_dict, str(path))
+        self._last_saved = iteration
+
+        if iteration in self._recent_iterations:
+            self._recent_iterations.remove(iteration)
+        if not keep:
+            self._recent_iterations.append(iteration)
 
         # Remove earliest checkpoint if there are more on disk.
-        self._recent_iterations.append(iteration)
-        if len(self._recent_iterations) > self.keep_recent:
+        while len(self._recent_iterations) > self.keep_recent:
             self.remove_earliest_checkpoint()
 
-    def _state_dict(self):
+        usage = self.disk_usage()
+        logging.info(
+            f"Checkpoints in {self.serialization_dir}: {usage['files']} files, "
+            f"{usage['bytes'] / 2**20:.1f} MB, {usage['free'] / 2**30:.1f} GB free on the disk"
+        )
+
+        return str(path)
+
+    def disk_usage(self) -> Dict[str, int]:
+        r"""
+        Number of files and bytes of the checkpoints of this manager on disk
+        (the ones still being written aren't counted), and the free space of
+        the disk.
+        """
+        pattern = self.filename.replace("{}", "*")
+        files = set(self.serialization_dir.glob(pattern))
+        if self._best_path is not None and self._best_path.is_file():
+            files.add(self._best_path)
+
+        return {
+            "files": len(files),
+            "bytes": sum(f.stat().st_size for f in files if f.is_file()),
+            "free": shutil.disk_usage(self.serialization_dir).free,
+        }
+
+    def _state_dict(self, checkpointables=None):
         r"""Return a dict containing state dict of all checkpointables."""
 
+        checkpointables = checkpointables or self.checkpointables
         __state_dict: Dict[str, Any] = {}
-        for key in self.checkpointables:
+        for key in checkpointables:
             if isinstance(
-                self.checkpointables[key], nn.parallel.DistributedDataParallel
+                checkpointables[key], nn.parallel.DistributedDataParallel
             ):
-                __state_dict[key] = self.checkpointables[key].module.state_dict()
+                __state_dict[key] = checkpointables[key].module.state_dict()
             else:
-                __state_dict[key] = self.checkpointables[key].state_dict()
+                __state_dict[key] = checkpointables[key].state_dict()
 
         return __state_dict
 
@@ -134,7 +226,11 @@ class CheckpointManager:
         r"""Remove earliest serialized checkpoint from disk."""
 
         earliest_iteration = self._recent_iterations.pop(0)
-        (self.serialization_dir / f"checkpoint_{earliest_iteration}.pth").unlink()
+        self._remove(self.path(earliest_iteration))
+
+    def _remove(self, path):
+        # the file may still be in the writer queue, it is removed after it is written
+        remove_checkpoint(str(path))
 
     def load(self, checkpoint_path: str):
         r"""
@@ -156,8 +252,11 @@ class CheckpointManager:
         # rank = dist.get_rank()
 
         # logger.info(f"Rank {rank}: Loading checkpoint from {checkpoint_path}")
+        flush_checkpoints()
         checkpoint = torch.load(checkpoint_path, map_location="cpu")
-        iteration = checkpoint.pop("iteration", -1)
+        # checkpoints written before the manager keep them as epoch and best_acc
+        iteration = checkpoint.pop("iteration", checkpoint.get("epoch", -1))
+        self._best_metric = checkpoint.pop("best_metric", checkpoint.get("best_acc", self._best_metric))
 
         # Keep flags of all checkpointables to lo which ones were not loaded.
         is_loaded = {key: False for key in self.checkpointables}
@@ -8,24 +8,34 @@ from models.active_learning.al_method_enum import get_al_method_enum
 
 from models.utils.ssl_method_enum import SSL_Method, get_ssl_method
 from datautils.dataset_enum import get_dataset_enum
+from datautils.path_loss_store import PathLossStore
+from utils.checkpoint_writer import flush_checkpoints, save_checkpoint
+from utils.checkpointing import CheckpointManager
 import utils.logger as logging
 
 
-def save_state(args, model, optimizer, pretrain_level="1", optimizer_type="Adam-Cosine"):
-    if not os.path.isdir(args.model_checkpoint_path):
-        os.makedirs(args.model_checkpoint_path)
-
+def get_checkpoint_manager(args, model, optimizer, pretrain_level="1", optimizer_type="Adam-Cosine"):
+    """Manager of the {method}_{level}_checkpoint_{epoch}.tar checkpoints of a pretraining run"""
     prefix = get_ssl_method(args.method)
-    out = os.path.join(args.model_checkpoint_path, "{}_{}_checkpoint_{}.tar".format(prefix, pretrain_level, args.current_epoch))
 
-    state = {
-        'model': model.state_dict(),
-        optimizer_type + '-optimizer': optimizer.state_dict()
-    }
-    torch.save(state, out)
-
-    print("checkpoint saved at {}".format(out))
-    args.resume = out
+    return CheckpointManager(
+        args, args.model_checkpoint_path,
+        filename="{}_{}_checkpoint_{{}}.tar".format(prefix, pretrain_level),
+        keep_recent=args.checkpoint_keep_recent,
+        save_every=args.checkpoint_freq,
+        best_filename=None,
+        **{'model': model, optimizer_type + '-optimizer': optimizer})
+
+def save_state(args, checkpoints, final=False):
+    """
+    Saves the checkpoint of the current epoch if it is on the checkpoint_freq cadence. The final
+    checkpoint of a run is always saved and is never removed by the retention.
+    """
+    out = checkpoints.step(args.current_epoch, force=final, keep=final)
+
+    if out is not None:
+        print("checkpoint saved at {}".format(out))
+        args.resume = out
 
 def load_saved_state(args, recent=True, pretrain_level="1"):
     try:
@@ -40,6 +50,7 @@ def load_saved_state(args, recent=True, pretrain_level="1"):
                 args.model_checkpoint_path, "{}_{}_checkpoint_{}.tar".format(prefix, pretrain_level, epoch_num)
             )
 
+        flush_checkpoints()
         return torch.load(out, map_location=args.device.type)
 
     except IOError as er:
@@ -63,7 +74,8 @@ def load_chkpts(args, filename, model):
             args.model_checkpoint_path, filename
         )
     
-        state_dict = torch.load(out, map_location="cuda:0")
+        flush_checkpoints()
+        state_dict = torch.load(out, map_location=args.device)
         if "state_dict" in state_dict:
             state_dict = state_dict["state_dict"]
         # remove prefixe "module."
@@ -89,11 +101,12 @@ def simple_save_model(args, model, path):
     }
 
     out = os.path.join(args.model_checkpoint_path, path)
-    torch.save(state, out)
+    save_checkpoint(args, state, out)
 
 def simple_load_model(args, path):
     try:
         out = os.path.join(args.model_checkpoint_path, path)
+        flush_checkpoints()
         return torch.load(out)
 
     except IOError as er:
@@ -120,27 +133,42 @@ def accuracy(pred, target, topk=1):
     return res[0] if return_single else res
 
 
-def save_path_loss(args, filename, image_loss_list):
-    filename = "{}_{}".format(get_dataset_enum(args.target_dataset), filename)
-    out = os.path.join(args.model_misc_path, filename)
+def get_path_loss_dir(args, filename):
+    filename = "{}_{}".format(get_dataset_enum(args.target_dataset), os.path.splitext(filename)[0])
+    return os.path.join(args.model_misc_path, filename)
 
-    try:
-        with open(out, "wb") as file:
-            pickle.dump(image_loss_list, file)
+def write_path_loss(args, filename, paths, losses):
+    out = get_path_loss_dir(args, filename)
 
+    try:
+        store = PathLossStore.write(out, paths, losses)
         logging.info(f"path loss saved at {out}")
+        return store
 
     except IOError as er:
-        # logging.error(er)
-        None
+        # the active learning needs the store, it can't go on without it
+        logging.error(er)
+        raise
+
+def save_path_loss(args, filename, image_loss_list):
+    paths = []
+    for path_loss in image_loss_list:
+        path = path_loss.path
+        paths.append(path[0] if isinstance(path, (tuple, list)) else path)
+
+    return write_path_loss(args, filename, paths, [path_loss.loss for path_loss in image_loss_list])
 
 
 def load_path_loss(args, filename):
-    filename = "{}_{}".format(get_dataset_enum(args.target_dataset), filename)
-    out = os.path.join(args.model_misc_path, filename)
+    out = get_path_loss_dir(args, filename)
+    if PathLossStore.exists(out):
+        return PathLossStore(out)
+
+    # fall back to the pickled list of PathLoss written by older runs
+    legacy = os.path.join(args.model_misc_path, "{}_{}".format(get_dataset_enum(args.target_dataset), filename))
 
     try:
-        with open(out, "rb") as file:
+        with open(legacy, "rb") as file:
             return pickle.load(file)
 
     except IOError as er:
@@ -179,30 +207,6 @@ def load_accuracy_file(args):
         # logging.error(er)
         return None
 
-def save_class_names(args, label):
-    filename = f"{get_dataset_enum(args.target_dataset)}.txt"
-    out = os.path.join(args.model_misc_path, filename)
-
-    try:
-        with open(out, "a") as file:
-            file.write(f"{str(label)}\n")
-
-    except IOError as er:
-        logging.error(er)
-        None
-
-def load_class_names(args):
-    filename = f"{get_dataset_enum(args.target_dataset)}.txt"
-    out = os.path.join(args.model_misc_path, filename)
-
-    try:
-        with open(out) as file:
-            return file.readlines()
-
-    except IOError as er:
-        logging.error(er)
-        return None
-
 def pil_loader(path):
         # open path as file to avoid ResourceWarning (https://github.com/python-pillow/Pillow/issues/835)
         with open(path, 'rb') as f:
@@ -0,0 +1,56 @@
+'''
+Device placement and the CPU execution mode.
+
+`args.device` decides where every model and batch lives. It is cuda:0 when a GPU is there,
+unless `device` is set in config.yaml (e.g. "cpu" on the scoring and eval farms). On CPU the
+cpu_* options tune the execution: the number of intra-op threads, channels_last tensors
+(the layout the oneDNN convolutions are fastest with) and bfloat16 autocast.
+'''
+
+import torch
+
+
+def configure_device(args):
+    """Returns the device to run on and applies the CPU thread settings when it is a CPU"""
+    if args.device:
+        device = torch.device(args.device)
+    else:
+        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+    if device.type == "cpu":
+        if args.cpu_threads > 0:
+            torch.set_num_threads(args.cpu_threads)
+        torch.backends.mkldnn.enabled = True
+
+    return device
+
+
+def is_cpu(args):
+    return torch.device(args.device).type == "cpu"
+
+
+def use_channels_last(args):
+    return is_cpu(args) and args.cpu_channels_last
+
+
+def prepare_model(args, model):
+    """Moves the model to the device, in channels_last layout in the CPU mode"""
+    model = model.to(args.device)
+    if use_channels_last(args):
+        model = model.to(memory_format=torch.channels_last)
+
+    return model
+
+
+def to_device(args, x):
+    """Moves a batch of images to the device, in channels_last layout in the CPU mode"""
+    x = x.to(args.device, non_blocking=True)
+    if use_channels_last(args) and x.dim() == 4:
+        x = x.contiguous(memory_format=torch.channels_last)
+
+    return x
+
+
+def cpu_autocast(args):
+    """bfloat16 autocast on CPU when cpu_bf16 is set, a no-op context otherwise"""
+    return torch.autocast("cpu", dtype=torch.bfloat16, enabled=is_cpu(args) and args.cpu_bf16)
@@ -0,0 +1,57 @@
+'''
+Mixed precision policy shared by the trainers.
+
+`precision` in config.yaml selects it:
+    off     everything in float32
+    fp16    float16 autocast with dynamic loss scaling (GradScaler), CUDA only
+    bf16    bfloat16 autocast, no loss scaling needed
+
+The parameters, their gradients and the optimizer states stay in float32 (the master copy),
+only the activations of the autocast region are in half precision. Losses are computed from
+the float32 cast of the outputs.
+'''
+
+import torch
+
+import utils.logger as logging
+
+PRECISIONS = {
+    "off": None,
+    "fp16": torch.float16,
+    "bf16": torch.bfloat16,
+}
+
+
+class MixedPrecision():
+    def __init__(self, args) -> None:
+        if args.precision not in PRECISIONS:
+            raise ValueError(f"'{args.precision}' precision doesn't exist, use one of {list(PRECISIONS)}")
+
+        self.device_type = torch.device(args.device).type
+        self.mode = args.precision
+
+        if self.mode == "fp16" and self.device_type != "cuda":
+            logging.warn("fp16 autocast needs CUDA, using bf16 instead")
+            self.mode = "bf16"
+
+        self.dtype = PRECISIONS[self.mode]
+        self.enabled = self.dtype is not None
+        self.scaler = torch.amp.GradScaler("cuda", enabled=self.mode == "fp16")
+
+    def autocast(self):
+        """Context for the forward passes, a no-op when the policy is off"""
+        return torch.autocast(self.device_type, dtype=self.dtype, enabled=self.enabled)
+
+    def backward(self, loss):
+        self.scaler.scale(loss).backward()
+
+    def step(self, optimizer):
+        """Unscales the gradients, skips the step if they overflowed and updates the loss scale"""
+        self.scaler.step(optimizer)
+        self.scaler.update()
+
+    def state_dict(self):
+        return self.scaler.state_dict()
+
+    def load_state_dict(self, state):
+        self.scaler.load_state_dict(state)